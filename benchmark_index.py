@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+import faiss
+
+from src.application.ann import (
+    TRAIN_SAMPLE_SIZE,
+    default_factories,
+    index_bytes,
+    latency_summary,
+    mmap_io_flags,
+    new_faiss_index,
+    recall_at_k,
+    search_sweep,
+    set_search_params,
+)
+from src.application.index import RetrievalIndex
+
+
+def stored_vectors(index: RetrievalIndex) -> np.ndarray:
+    """The index's vectors in chunk id order, as exact as the stored codes allow."""
+    faiss_index = index.faiss_index
+    if isinstance(faiss_index, faiss.IndexIDMap2):
+        ids = faiss.vector_to_array(faiss_index.id_map)
+        vectors = np.empty((len(ids), faiss_index.d), dtype=np.float32)
+        vectors[ids] = faiss_index.index.reconstruct_n(0, len(ids))
+        return vectors
+    return faiss_index.reconstruct_n(0, faiss_index.ntotal)
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def read_queries(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["query"] for line in lines]
+    return lines
+
+
+def search_all(index, queries: np.ndarray, top_k: int):
+    """One query at a time, as the pipeline searches; returns ids and latencies."""
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), top_k)
+        latencies.append(time.perf_counter() - start)
+        ids.append(found[0])
+    return np.asarray(ids), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare recall@k and latency of approximate FAISS indexes against exact search"
+    )
+    parser.add_argument(
+        "--index-dir",
+        type=str,
+        required=True,
+        help="Built retrieval index (textbook, corpus or Mathlib) whose vectors are benchmarked",
+    )
+    parser.add_argument(
+        "--factories",
+        nargs="+",
+        default=None,
+        help="FAISS index factories to compare (default: IVF-Flat, IVF-PQ and HNSW32 sized for the index)",
+    )
+    parser.add_argument(
+        "--queries",
+        type=str,
+        default=None,
+        help="Text or JSONL file of queries to embed (default: sample stored vectors as queries)",
+    )
+    parser.add_argument(
+        "--num-queries",
+        type=int,
+        default=200,
+        help="Stored vectors sampled as queries without --queries (default: 200)",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=10,
+        help="k for recall@k (default: 10)",
+    )
+    parser.add_argument(
+        "--train-size",
+        type=int,
+        default=TRAIN_SAMPLE_SIZE,
+        help=f"Vectors sampled to train IVF/PQ indexes (default: {TRAIN_SAMPLE_SIZE})",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="index_benchmark.json",
+        help="Report file (default: index_benchmark.json)",
+    )
+    args = parser.parse_args()
+
+    try:
+        index = RetrievalIndex.load(args.index_dir)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if index.metadata.index_factory != "Flat":
+        print(
+            f"Warning: the index stores {index.metadata.index_factory} codes, so the "
+            "exact baseline is computed on reconstructed (approximate) vectors"
+        )
+    vectors = stored_vectors(index)
+    num_vectors, dim = vectors.shape
+    print(f"Loaded {num_vectors} vectors of dimension {dim} from {args.index_dir}")
+
+    if args.queries:
+        from langchain.embeddings import HuggingFaceEmbeddings
+
+        texts = read_queries(args.queries)
+        embeddings = HuggingFaceEmbeddings(model_name=index.metadata.embedding_model)
+        queries = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    else:
+        rows = np.random.default_rng(0).choice(
+            num_vectors, min(args.num_queries, num_vectors), replace=False
+        )
+        queries = vectors[rows]
+    top_k = min(args.top_k, num_vectors)
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    exact_ids, exact_latencies = search_all(exact, queries, top_k)
+
+    factories = args.factories or default_factories(num_vectors, dim)
+    report = {
+        "index_dir": args.index_dir,
+        "num_vectors": num_vectors,
+        "dimension": dim,
+        "num_queries": len(queries),
+        "top_k": top_k,
+        "results": [
+            {
+                "factory": "Flat",
+                "search_params": "",
+                "build_seconds": 0.0,
+                "load_ms": None,
+                "load_rss_mb": None,
+                "size_mb": index_bytes(exact) / 2**20,
+                f"recall@{top_k}": 1.0,
+                **latency_summary(exact_latencies),
+            }
+        ],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for factory in factories:
+            start = time.perf_counter()
+            try:
+                candidate = new_faiss_index(vectors, factory, args.train_size)
+            except ValueError as e:
+                print(f"Skipping {factory}: {e}")
+                continue
+            candidate.add(vectors)
+            build_seconds = time.perf_counter() - start
+
+            # Serve from a memory-mapped copy, as the pipeline does. The RSS
+            # growth shows how much of the index the load read into memory.
+            path = os.path.join(tmp, "candidate.index")
+            faiss.write_index(candidate, path)
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            loaded = faiss.read_index(path, mmap_io_flags(factory))
+            load_ms = (time.perf_counter() - start) * 1000
+            rss_after = rss_mb()
+            load_rss_mb = rss_after - rss_before if rss_before is not None else None
+
+            for params in search_sweep(factory):
+                set_search_params(loaded, params)
+                ids, latencies = search_all(loaded, queries, top_k)
+                report["results"].append(
+                    {
+                        "factory": factory,
+                        "search_params": params,
+                        "build_seconds": build_seconds,
+                        "load_ms": load_ms,
+                        "load_rss_mb": load_rss_mb,
+                        "size_mb": index_bytes(candidate) / 2**20,
+                        f"recall@{top_k}": recall_at_k(ids, exact_ids),
+                        **latency_summary(latencies),
+                    }
+                )
+            del loaded
+
+    print(
+        f"\n{'factory':<18}{'params':<14}{'build s':>9}{'load ms':>9}{'load MB':>9}{'MB':>9}"
+        f"{f'recall@{top_k}':>11}{'mean ms':>9}{'p95 ms':>9}"
+    )
+    for row in report["results"]:
+        load_ms = f"{row['load_ms']:.1f}" if row["load_ms"] is not None else "-"
+        load_rss = f"{row['load_rss_mb']:.1f}" if row["load_rss_mb"] is not None else "-"
+        print(
+            f"{row['factory']:<18}{row['search_params']:<14}{row['build_seconds']:>9.1f}"
+            f"{load_ms:>9}{load_rss:>9}{row['size_mb']:>9.1f}{row[f'recall@{top_k}']:>11.3f}"
+            f"{row['mean_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import multiprocessing
+import queue
+import resource
+import sys
+import time
+from typing import List
+
+from src.application.quantization import PRECISIONS
+
+DEFAULT_QUERIES = [
+    "The fundamental group of the circle is isomorphic to the integers",
+    "A continuous map between topological spaces induces a homomorphism between their fundamental groups",
+    "The torus is a topological space whose fundamental group is isomorphic to the product of two copies of the integers",
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_precision(
+    model_name: str,
+    precision: str,
+    queries: List[str],
+    max_new_tokens: int,
+    cache_dir: str,
+    results,
+):
+    """Load one precision and decode every query greedily (child process)."""
+    import torch
+    from transformers import AutoTokenizer
+    from src.application.prompt import NO_CONTEXT_TEMPLATE
+    from src.application.quantization import load_model
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    start = time.perf_counter()
+    model = load_model(model_name, precision, "cpu", cache_dir)
+    load_time = time.perf_counter() - start
+
+    outputs, latencies = [], []
+    for query in queries:
+        input_ids = tokenizer(
+            NO_CONTEXT_TEMPLATE.format(facts="", query=query), return_tensors="pt"
+        )["input_ids"]
+        start = time.perf_counter()
+        with torch.no_grad():
+            generated = model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+            )
+        latencies.append(time.perf_counter() - start)
+        outputs.append(generated[0, input_ids.shape[1] :].tolist())
+
+    results.put(
+        {
+            "precision": precision,
+            "load_time": load_time,
+            "latencies": latencies,
+            "tokens": outputs,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    )
+
+
+def token_agreement(baseline: List[int], other: List[int]) -> float:
+    """Fraction of baseline tokens reproduced before the first divergence."""
+    if not baseline:
+        return 1.0 if not other else 0.0
+    matched = 0
+    for a, b in zip(baseline, other):
+        if a != b:
+            break
+        matched += 1
+    return matched / len(baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare CPU latency, memory and output agreement across model precisions"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="deepseek-ai/DeepSeek-Prover-V2-7B",
+        help="HuggingFace model name",
+    )
+    parser.add_argument(
+        "--precisions",
+        nargs="+",
+        choices=PRECISIONS,
+        default=["fp16", "bf16", "int8", "int4"],
+        help="Precisions to benchmark; the first one is the baseline (default: fp16 bf16 int8 int4)",
+    )
+    parser.add_argument(
+        "--max-new-tokens",
+        type=int,
+        default=128,
+        help="Tokens to decode per query (default: 128)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".model_cache",
+        help="Directory for converted quantized weights (default: .model_cache)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="precision_benchmark.json",
+        help="Output file for the report (default: precision_benchmark.json)",
+    )
+
+    args = parser.parse_args()
+
+    # Each precision runs in a fresh process so peak RSS is measured per
+    # precision rather than accumulated across them.
+    context = multiprocessing.get_context("spawn")
+    runs = {}
+    for precision in args.precisions:
+        print(f"Benchmarking {precision}...")
+        results = context.Queue()
+        process = context.Process(
+            target=run_precision,
+            args=(
+                args.model,
+                precision,
+                DEFAULT_QUERIES,
+                args.max_new_tokens,
+                args.cache_dir,
+                results,
+            ),
+        )
+        process.start()
+        while True:
+            try:
+                runs[precision] = results.get(timeout=5)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    print(f"Error: {precision} run exited with code {process.exitcode}")
+                    sys.exit(1)
+        process.join()
+
+    baseline = runs[args.precisions[0]]
+    report = {"model": args.model, "baseline": args.precisions[0], "precisions": {}}
+    print(
+        f"\n{'precision':<10}{'load s':>9}{'s/query':>10}{'tok/s':>8}{'peak MB':>10}{'agreement':>11}"
+    )
+    for precision, run in runs.items():
+        total_tokens = sum(len(t) for t in run["tokens"])
+        total_time = sum(run["latencies"])
+        agreement = sum(
+            token_agreement(b, o) for b, o in zip(baseline["tokens"], run["tokens"])
+        ) / len(DEFAULT_QUERIES)
+        exact = sum(b == o for b, o in zip(baseline["tokens"], run["tokens"]))
+        report["precisions"][precision] = {
+            "load_time": run["load_time"],
+            "mean_latency": total_time / len(DEFAULT_QUERIES),
+            "tokens_per_second": total_tokens / total_time if total_time else 0.0,
+            "peak_rss_mb": run["peak_rss_mb"],
+            "token_agreement": agreement,
+            "exact_matches": exact,
+        }
+        row = report["precisions"][precision]
+        print(
+            f"{precision:<10}{row['load_time']:>9.1f}{row['mean_latency']:>10.2f}"
+            f"{row['tokens_per_second']:>8.2f}{row['peak_rss_mb']:>10.0f}{agreement:>11.2%}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+
+from src.application.mathlib import build_mathlib_index, default_index_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index the declarations of the pinned Mathlib for retrieval"
+    )
+    parser.add_argument(
+        "--repl-dir",
+        type=str,
+        default="repl",
+        help="Lake project whose .lake/packages/mathlib checkout is indexed (default: repl)",
+    )
+    parser.add_argument(
+        "--index-dir",
+        type=str,
+        default=None,
+        help="Output directory (default: .rag_index/mathlib-<revision>)",
+    )
+    parser.add_argument(
+        "--embedding-model",
+        type=str,
+        default="sentence-transformers/all-MiniLM-L6-v2",
+        help="Embedding model; must match the one the pipeline uses",
+    )
+    parser.add_argument(
+        "--index-factory",
+        type=str,
+        default="SQ8",
+        help="FAISS index factory string, e.g. Flat, SQ8, IVF4096,PQ96 or HNSW32 (default: SQ8, one byte per dimension); see benchmark_index.py",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to scan Lean files (default: one per CPU)",
+    )
+    args = parser.parse_args()
+
+    from langchain.embeddings import HuggingFaceEmbeddings
+
+    index_dir = args.index_dir or default_index_dir(args.repl_dir)
+    start = time.perf_counter()
+    try:
+        index = build_mathlib_index(
+            args.repl_dir,
+            index_dir,
+            HuggingFaceEmbeddings(model_name=args.embedding_model),
+            args.embedding_model,
+            index_factory=args.index_factory,
+            workers=args.workers,
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(
+        f"Indexed {len(index.chunks)} declarations in {time.perf_counter() - start:.0f}s; "
+        f"saved to {index_dir}"
+    )
+    print(f"Use it with: python formalize.py --mathlib-index {index_dir} ...")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,202 +1,221 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
-import sys
-import signal
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List
 from src.application.rag import MathematicalRAGPipeline
 
+DEFAULT_QUERIES = [
+    "The fundamental group of the circle is isomorphic to the integers",
+    "A continuous map between topological spaces induces a homomorphism between their fundamental groups",
+    "The torus is a topological space whose fundamental group is isomorphic to the product of two copies of the integers",
+]
+
+
+def run_job(
+    pipeline: MathematicalRAGPipeline,
+    query: str,
+    method: str,
+    top_k: int,
+    timeout: float,
+) -> dict:
+    """Formalize one query with one method, recording status and latencies."""
+    start = time.perf_counter()
+    result = {
+        "query": query,
+        "method": method,
+        "status": "ok",
+        "lean_code": None,
+        "context_used": None,
+        "context_scores": None,
+        "context_tokens": 0,
+        "rerank_timed_out": False,
+        "stage_timings": {},
+        "error": None,
+    }
+    try:
+        # One scheduler client per method keeps admission fair between methods
+        lean_code, metrics = pipeline.formalize_with_rag(
+            query, method=method, top_k=top_k, client=method, timeout=timeout
+        )
+        result.update(
+            lean_code=lean_code,
+            context_used=metrics.retrieved_contexts if method != "no_rag" else None,
+            context_scores=metrics.retrieval_scores if method != "no_rag" else None,
+            stage_timings=metrics.stage_timings,
+            context_tokens=metrics.context_tokens,
+            rerank_timed_out=metrics.rerank_timed_out,
+        )
+    except TimeoutError as e:
+        result.update(status="timeout", error=str(e))
+    except Exception as e:
+        result.update(status="error", error=str(e))
+    result["total_seconds"] = time.perf_counter() - start
+    return result
 
-class TimeoutError(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutError("Operation timed out")
-
-
-def run_comparison(query: str, output_dir: str = "comparison_results"):
-    """Run the same query with all available methods and save results"""
-
-    import os
 
+def summarize(results: List[dict], methods: List[str]) -> Dict[str, dict]:
+    summary = {}
+    for method in methods:
+        runs = [r for r in results if r["method"] == method]
+        ok = [r for r in runs if r["status"] == "ok"]
+        stages = sorted({stage for r in ok for stage in r["stage_timings"]})
+        summary[method] = {
+            "ok": len(ok),
+            "timeout": sum(r["status"] == "timeout" for r in runs),
+            "error": sum(r["status"] == "error" for r in runs),
+            "mean_stage_seconds": {
+                stage: sum(r["stage_timings"].get(stage, 0.0) for r in ok) / len(ok)
+                for stage in stages
+            },
+            "mean_total_seconds": (
+                sum(r["total_seconds"] for r in ok) / len(ok) if ok else None
+            ),
+        }
+    return summary
+
+
+def run_comparison(
+    pipeline: MathematicalRAGPipeline,
+    queries: List[str],
+    methods: List[str],
+    top_k: int = 5,
+    timeout: float = 300.0,
+    max_workers: int = 8,
+    output_dir: str = "comparison_results",
+) -> str:
+    """Run every query with every method and save one consolidated report.
+
+    Jobs run concurrently on a thread pool. With the pipeline's scheduler
+    running, their generations share one continuously batched decode loop,
+    and a job that exceeds ``timeout`` stops between decode steps instead of
+    blocking the others.
+    """
     os.makedirs(output_dir, exist_ok=True)
-
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    print(f"Running comparison for query: {query}")
-    print(f"Results will be saved to: {output_dir}")
-
-    print("Initializing RAG pipeline...")
-    pipeline = MathematicalRAGPipeline()
-
-    methods = ["no_rag", "hybrid"]
-
-    all_results = {}
-    context_details = {}
-
-    for method in methods:
-        print(f"\n--- Testing method: {method.upper()} ---")
-
-        try:
-            # Set timeout for generation (5 minutes)
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(300)
-
-            if method == "no_rag":
-                lean_code = pipeline.formalize_without_rag(query)
-                context_used = None
-            else:
-                lean_code, metrics = pipeline.formalize_with_rag(
-                    query, method=method, top_k=5
-                )
-                context_used = metrics.retrieved_contexts
-
-            # Cancel timeout
-            signal.alarm(0)
-
-            all_results[method] = {
-                "query": query,
-                "method": method,
-                "lean_code": lean_code,
-                "timestamp": timestamp,
-            }
-
-            context_details[method] = {
+    jobs = [(query, method) for query in queries for method in methods]
+    print(f"Running {len(jobs)} jobs ({len(queries)} queries x {len(methods)} methods)")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_job, pipeline, query, method, top_k, timeout)
+            for query, method in jobs
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            icon = {"ok": "✅", "timeout": "⏰", "error": "❌"}[result["status"]]
+            print(
+                f"{icon} {result['method'].upper()} ({result['total_seconds']:.1f}s): {result['query'][:80]}"
+            )
+            results.append(result)
+    wall_time = time.perf_counter() - start
+
+    report = {
+        "timestamp": timestamp,
+        "model": pipeline.model_name,
+        "methods": methods,
+        "top_k": top_k,
+        "timeout_seconds": timeout,
+        "wall_seconds": wall_time,
+        "startup_timings": pipeline.startup_timings(),
+        "summary": summarize(results, methods),
+        "queries": [
+            {
                 "query": query,
-                "method": method,
-                "context_used": context_used,
-                "context_count": len(context_used) if context_used else 0,
-                "timestamp": timestamp,
+                "results": {r["method"]: r for r in results if r["query"] == query},
             }
+            for query in queries
+        ],
+    }
 
-            print(f"✅ {method.upper()} completed successfully")
+    report_file = f"{output_dir}/report_{timestamp}.json"
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
 
-        except TimeoutError:
-            print(f"⏰ Timeout for {method} (5 minutes)")
-            all_results[method] = {
-                "query": query,
-                "method": method,
-                "lean_code": "TIMEOUT: Generation took too long (>5 minutes)",
-                "timestamp": timestamp,
-            }
-            context_details[method] = {
-                "query": query,
-                "method": method,
-                "context_used": None,
-                "context_count": 0,
-                "error": "Timeout",
-                "timestamp": timestamp,
-            }
-        except Exception as e:
-            print(f"❌ Error with {method}: {e}")
-            all_results[method] = {
-                "query": query,
-                "method": method,
-                "lean_code": f"ERROR: {e}",
-                "timestamp": timestamp,
-            }
-            context_details[method] = {
-                "query": query,
-                "method": method,
-                "context_used": None,
-                "context_count": 0,
-                "error": str(e),
-                "timestamp": timestamp,
-            }
-        finally:
-            # Cancel timeout
-            signal.alarm(0)
-
-    lean_output_file = f"{output_dir}/lean_code_comparison_{timestamp}.txt"
-    with open(lean_output_file, "w") as f:
-        f.write("=" * 80 + "\n")
-        f.write("LEAN CODE COMPARISON\n")
-        f.write("=" * 80 + "\n")
-        f.write(f"Query: {query}\n")
-        f.write(f"Timestamp: {timestamp}\n")
-        f.write("=" * 80 + "\n\n")
-
-        for method in methods:
-            f.write(f"METHOD: {method.upper()}\n")
-            f.write("-" * 40 + "\n")
-            f.write(all_results[method]["lean_code"])
-            f.write("\n\n" + "=" * 80 + "\n\n")
-
-    context_output_file = f"{output_dir}/context_details_{timestamp}.txt"
-    with open(context_output_file, "w") as f:
-        f.write("=" * 80 + "\n")
-        f.write("CONTEXT DETAILS\n")
-        f.write("=" * 80 + "\n")
-        f.write(f"Query: {query}\n")
-        f.write(f"Timestamp: {timestamp}\n")
-        f.write("=" * 80 + "\n\n")
-
-        for method in methods:
-            f.write(f"METHOD: {method.upper()}\n")
-            f.write("-" * 40 + "\n")
-
-            if method == "no_rag":
-                f.write("No context used (direct generation)\n")
-            else:
-                context_info = context_details[method]
-                f.write(f"Context chunks retrieved: {context_info['context_count']}\n")
-                f.write("\nRetrieved Context:\n")
-
-                if context_info["context_used"]:
-                    for i, context in enumerate(context_info["context_used"], 1):
-                        f.write(f"\n{i}. {context}\n")
-                        f.write("-" * 60 + "\n")
-                else:
-                    f.write("No context retrieved\n")
-
-            f.write("\n" + "=" * 80 + "\n\n")
-
-    json_output_file = f"{output_dir}/summary_{timestamp}.json"
-    with open(json_output_file, "w") as f:
-        json.dump(
-            {
-                "query": query,
-                "timestamp": timestamp,
-                "results": all_results,
-                "context_details": context_details,
-            },
-            f,
-            indent=2,
-        )
-
-    print(f"\n" + "=" * 60)
+    print("\n" + "=" * 60)
     print("COMPARISON COMPLETE!")
     print("=" * 60)
-    print(f"📄 Lean code comparison: {lean_output_file}")
-    print(f"📄 Context details: {context_output_file}")
-    print(f"📄 JSON summary: {json_output_file}")
+    for method, stats in report["summary"].items():
+        stages = ", ".join(
+            f"{stage} {seconds:.2f}s" for stage, seconds in stats["mean_stage_seconds"].items()
+        )
+        print(
+            f"{method.upper()}: {stats['ok']} ok, {stats['timeout']} timeout, {stats['error']} error"
+            + (f" | mean {stages}" if stages else "")
+        )
+    print(f"Total wall time: {wall_time:.1f}s")
+    print(f"📄 Report: {report_file}")
 
-    return lean_output_file, context_output_file, json_output_file
+    return report_file
 
 
 def main():
-    test_queries = [
-        "The fundamental group of the circle is isomorphic to the integers",
-        "A continuous map between topological spaces induces a homomorphism between their fundamental groups",
-        "The torus is a topological space whose fundamental group is isomorphic to the product of two copies of the integers",
-    ]
+    parser = argparse.ArgumentParser(description="Compare formalization methods")
+    parser.add_argument(
+        "--queries",
+        nargs="+",
+        default=DEFAULT_QUERIES,
+        help="Queries to formalize (default: three fundamental group statements)",
+    )
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=["no_rag", "hybrid"],
+        choices=["no_rag", "bm25", "dense", "hybrid"],
+        help="Methods to compare (default: no_rag hybrid)",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=5,
+        help="Number of context chunks to retrieve (default: 5)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300.0,
+        help="Per-job generation timeout in seconds (default: 300)",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=8,
+        help="Jobs run and decoded concurrently (default: 8)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="comparison_results",
+        help="Directory for the report (default: comparison_results)",
+    )
+
+    args = parser.parse_args()
 
     print("Autoformalization Method Comparison")
     print("=" * 50)
 
-    for i, query in enumerate(test_queries, 1):
-        print(f"\n🔄 Running comparison {i}/3")
-        print(f"Query: {query[:100]}...")
-
-        try:
-            lean_file, context_file, json_file = run_comparison(query)
-            print(f"✅ Comparison {i} completed successfully")
-        except Exception as e:
-            print(f"❌ Error in comparison {i}: {e}")
-
-    print(f"\n🎉 All comparisons completed!")
-    print("Check the 'comparison_results' directory for output files.")
+    print("Initializing RAG pipeline...")
+    pipeline = MathematicalRAGPipeline(persist_retrieval_cache=True)
+    pipeline.start_scheduler(args.max_batch_size)
+    try:
+        run_comparison(
+            pipeline,
+            args.queries,
+            args.methods,
+            top_k=args.top_k,
+            timeout=args.timeout,
+            max_workers=args.max_batch_size,
+            output_dir=args.output_dir,
+        )
+    finally:
+        pipeline.close()
 
 
 if __name__ == "__main__":
@@ -2,15 +2,229 @@
 
 import argparse
 import json
+import os
+import shlex
 import sys
+from dataclasses import asdict
 from pathlib import Path
-from src.application.rag import MathematicalRAGPipeline
+from typing import Dict, Iterator, List, Optional, Set
+from src.application.client import FormalizationClient, DEFAULT_SERVER_URL
+from src.application.lean_code import extract_lean_code
+
+
+def read_queries(path: str) -> List[Dict[str, str]]:
+    """Read queries from a JSONL file or a plain text file.
+
+    JSONL lines are objects with a ``query`` and an optional ``id``. Text
+    files have one query per line; blank lines and ``#`` comments are
+    skipped, and ``python formalize.py --query "..."`` lines (as in
+    queries.txt) contribute their ``--query`` argument.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Input file not found at {path}")
+
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                if "query" not in record:
+                    raise ValueError(f"{path}:{line_number}: missing 'query'")
+                queries.append(
+                    {"id": str(record.get("id", record["query"])), "query": record["query"]}
+                )
+            elif line.startswith("python "):
+                args = shlex.split(line)
+                if "--query" in args[:-1]:
+                    query = args[args.index("--query") + 1]
+                    queries.append({"id": query, "query": query})
+            else:
+                queries.append({"id": line, "query": line})
+    return queries
+
+
+def load_completed(path: str) -> Set[str]:
+    """Ids already present in a partially written output file.
+
+    A trailing line cut off by an interrupted run is dropped from the file
+    so that appended results start on a fresh line.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    completed, valid_lines = set(), []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if line.endswith("\n"):
+            completed.add(str(record.get("id", record.get("query"))))
+            valid_lines.append(line)
+
+    if len(valid_lines) != len(lines):
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(valid_lines)
+    return completed
+
+
+def rag_result(query: str, method: str, lean_code: str, metrics) -> dict:
+    return {
+        "query": query,
+        "method": method,
+        "lean_code": lean_code,
+        "context_used": metrics.retrieved_contexts,
+        "context_scores": metrics.retrieval_scores,
+        "metrics": {
+            "stage_timings": metrics.stage_timings,
+            "rerank_timed_out": metrics.rerank_timed_out,
+            "context_tokens": metrics.context_tokens,
+            "context_chunks_used": metrics.context_chunks_used,
+            "facts_used": metrics.retrieved_facts,
+            "candidates": metrics.candidates,
+            "candidates_checked": metrics.candidates_checked,
+        },
+        "verification": verification_dict(metrics.verification),
+    }
+
+
+def no_rag_result(query: str, lean_code: str, verification=None) -> dict:
+    return {
+        "query": query,
+        "method": "no_rag",
+        "lean_code": lean_code,
+        "context_used": None,
+        "metrics": None,
+        "verification": verification_dict(verification),
+    }
+
+
+def verification_dict(verification) -> Optional[dict]:
+    return asdict(verification) if verification is not None else None
+
+
+def formalize_batches(
+    pipeline, queries: List[Dict[str, str]], args
+) -> Iterator[List[dict]]:
+    for start in range(0, len(queries), args.batch_size):
+        batch = queries[start : start + args.batch_size]
+        texts = [q["query"] for q in batch]
+        if args.no_rag and args.verify:
+            results = [
+                no_rag_result(query, lean_code, metrics.verification)
+                for query, (lean_code, metrics) in zip(
+                    texts, pipeline.formalize_batch(texts, "no_rag")
+                )
+            ]
+        elif args.no_rag:
+            results = [
+                no_rag_result(query, lean_code)
+                for query, lean_code in zip(
+                    texts, pipeline.generate_lean_code_batch(texts)
+                )
+            ]
+        else:
+            results = [
+                rag_result(query, args.method, lean_code, metrics)
+                for query, (lean_code, metrics) in zip(
+                    texts, pipeline.formalize_batch(texts, args.method, args.top_k)
+                )
+            ]
+        yield [{"id": q["id"], **result} for q, result in zip(batch, results)]
+
+
+def run_batch(pipeline, args):
+    output = args.output or "results.jsonl"
+    queries = read_queries(args.input)
+    completed = load_completed(output)
+    # Duplicate ids (e.g. a query listed twice) are only formalized once
+    pending = list({q["id"]: q for q in queries if q["id"] not in completed}.values())
+    print(
+        f"{len(queries)} queries in {args.input}: {len(queries) - len(pending)} already in {output}, {len(pending)} to run"
+    )
+
+    done = 0
+    checks = []
+    with open(output, "a", encoding="utf-8") as f:
+        for results in formalize_batches(pipeline, pending, args):
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+                if result.get("verification") is not None:
+                    checks.append(result["verification"])
+            # Flush per batch so an interrupted run can resume from here
+            f.flush()
+            done += len(results)
+            print(f"Formalized {done}/{len(pending)} queries")
+
+    if checks:
+        seconds = [c["seconds"] for c in checks]
+        print(
+            f"\nLean verification: {sum(c['success'] for c in checks)}/{len(checks)} compiled, "
+            f"{sum(c['timed_out'] for c in checks)} timed out, "
+            f"{sum(c.get('cached', False) for c in checks)} cached | "
+            f"check time mean {sum(seconds) / len(seconds):.2f}s, max {max(seconds):.2f}s"
+        )
+    print(f"\nResults saved to: {output}")
+
+
+def print_pipeline_stats(pipeline):
+    # Only an in-process pipeline has startup and speculation statistics
+    if isinstance(pipeline, FormalizationClient):
+        return
+    print("\nStartup timings:")
+    for name, timing in pipeline.startup_timings().items():
+        print(
+            f"  {name}: started at +{timing['started']:.2f}s, loaded in {timing['seconds']:.2f}s"
+        )
+    if pipeline.speculative is not None:
+        print(f"\nSpeculative decoding: {pipeline.speculative.stats()}")
+    if pipeline.lean_workers > 0:
+        print(f"\nVerification cache: {pipeline.verifier.cache.stats()}")
+
+
+def ignored_flags(args, health: dict) -> List[str]:
+    """Local pipeline flags that differ from the running server's settings.
+
+    The server's pipeline was configured when it started, so these flags
+    have no effect on requests sent to it.
+    """
+    local = {
+        "model": args.model,
+        "textbook": os.path.normpath(args.textbook),
+        "chunker": args.chunker,
+        "index_factory": args.index_factory,
+        "mathlib_index": args.mathlib_index,
+        "verify": args.verify,
+        "candidates": args.candidates,
+    }
+    ignored = []
+    for name, value in local.items():
+        # Servers from before a setting was reported omit it
+        if name not in health:
+            continue
+        served = health[name]
+        if name == "textbook":
+            served = os.path.normpath(served)
+        if served != value:
+            ignored.append(f"--{name.replace('_', '-')} (server: {served}, local: {value})")
+    return ignored
 
 
 def main():
     parser = argparse.ArgumentParser(description="Mathematical formalization with RAG")
-    parser.add_argument(
-        "--query", type=str, required=True, help="Natural language mathematical query"
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--query", type=str, help="Natural language mathematical query"
+    )
+    source.add_argument(
+        "--input",
+        type=str,
+        help="Formalize every query in a .jsonl file ({\"id\", \"query\"} per line) or a text file (one query per line)",
     )
     parser.add_argument(
         "--method",
@@ -31,14 +245,20 @@ def main():
     parser.add_argument(
         "--output",
         type=str,
-        default="output.json",
-        help="Output file for results (default: output.json)",
+        default=None,
+        help="Output file for results (default: output.json, or results.jsonl with --input; an existing JSONL output is resumed)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Queries retrieved and generated together with --input (default: 8)",
     )
     parser.add_argument(
         "--textbook",
         type=str,
         default="dataset/converted.txt",
-        help="Path to textbook markdown file (default: dataset/converted.txt)",
+        help="Path to textbook markdown file, or a directory of .md/.txt documents to index as one corpus (default: dataset/converted.txt)",
     )
     parser.add_argument(
         "--model",
@@ -46,26 +266,268 @@ def main():
         default="deepseek-ai/DeepSeek-Prover-V2-7B",
         help="HuggingFace model name",
     )
+    parser.add_argument(
+        "--chunker",
+        type=str,
+        default="structured",
+        choices=["structured", "recursive"],
+        help="Split the textbook at headings and theorem/proof labels, or into fixed-size overlapping pieces (default: structured)",
+    )
+    parser.add_argument(
+        "--mathlib-index",
+        type=str,
+        default=None,
+        help="Index of Mathlib declarations built by build_mathlib_index.py; relevant facts are added to the prompt (default: none)",
+    )
+    parser.add_argument(
+        "--mathlib-top-k",
+        type=int,
+        default=5,
+        help="Number of Mathlib facts to retrieve with --mathlib-index (default: 5)",
+    )
+    parser.add_argument(
+        "--index-dir",
+        type=str,
+        default=None,
+        help="Directory for the persistent retrieval index (default: .rag_index/<textbook name>)",
+    )
+    parser.add_argument(
+        "--index-factory",
+        type=str,
+        default="Flat",
+        help="FAISS index for the textbook vectors, e.g. Flat (exact), IVF1024,PQ32 or HNSW32 (default: Flat); see benchmark_index.py",
+    )
+    parser.add_argument(
+        "--index-search-params",
+        type=str,
+        default=None,
+        help="FAISS search parameters for approximate indexes, e.g. nprobe=16 or efSearch=128",
+    )
+    parser.add_argument(
+        "--fusion",
+        type=str,
+        default="rrf",
+        choices=["rrf", "weighted"],
+        help="How hybrid retrieval combines BM25 and dense rankings (default: rrf)",
+    )
+    parser.add_argument(
+        "--reranker",
+        type=str,
+        default=None,
+        help="Cross-encoder used to rerank retrieved candidates, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 (default: no reranking)",
+    )
+    parser.add_argument(
+        "--rerank-candidates",
+        type=int,
+        default=50,
+        help="Number of first-stage candidates scored by the reranker (default: 50)",
+    )
+    parser.add_argument(
+        "--rerank-budget-ms",
+        type=float,
+        default=200.0,
+        help="Per-query reranking time budget; first-stage order is kept when exceeded (default: 200)",
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        help="Token budget for retrieved context in the prompt (default: whatever fits in 2048 prompt tokens)",
+    )
+    parser.add_argument(
+        "--prefix-cache-mb",
+        type=int,
+        default=0,
+        help="Memory cap for reusing key/values of shared prompt prefixes; 0 disables (default: 0)",
+    )
+    parser.add_argument(
+        "--no-early-stop",
+        action="store_true",
+        help="Keep generating after the Lean code block is complete (until EOS or the token limit)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default=None,
+        choices=["fp16", "bf16", "fp32", "int8", "int4"],
+        help="Prover weight precision; int8/int4 are CPU-only and converted once into --quantized-dir (default: fp16 on GPU, bf16 on CPU)",
+    )
+    parser.add_argument(
+        "--quantized-dir",
+        type=str,
+        default=".model_cache",
+        help="Directory for converted quantized weights (default: .model_cache)",
+    )
+    parser.add_argument(
+        "--draft-model",
+        type=str,
+        default=None,
+        help="Small model proposing tokens for the prover to verify (speculative decoding)",
+    )
+    parser.add_argument(
+        "--prompt-lookup",
+        type=int,
+        default=0,
+        help="Speculate this many tokens per step by n-gram lookup in the prompt; 0 disables (default: 0)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Type-check generated code with warm Lean REPL workers from repl/",
+    )
+    parser.add_argument(
+        "--lean-workers",
+        type=int,
+        default=2,
+        help="Lean REPL processes used with --verify (default: 2)",
+    )
+    parser.add_argument(
+        "--lean-timeout",
+        type=float,
+        default=60.0,
+        help="Per-check Lean timeout in seconds (default: 60)",
+    )
+    parser.add_argument(
+        "--verification-cache",
+        action="store_true",
+        help="Keep Lean check results in repl/.lake across runs (they are always cached in memory)",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="With --verify, sample this many candidates in one batch and keep the first that compiles (default: 1)",
+    )
+    parser.add_argument(
+        "--retrieval-cache",
+        action="store_true",
+        help="Keep cached query embeddings and rankings in the index directory across runs",
+    )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=DEFAULT_SERVER_URL,
+        help=f"Formalization server to use if one is running (default: {DEFAULT_SERVER_URL})",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the generated Lean code incrementally as it is decoded",
+    )
+    parser.add_argument(
+        "--no-server",
+        action="store_true",
+        help="Always load the pipeline in-process, even if a server is running",
+    )
 
     args = parser.parse_args()
+    if args.input and args.stream:
+        parser.error("--stream cannot be combined with --input")
+    if args.candidates > 1 and not args.verify:
+        parser.error("--candidates needs --verify")
+    if args.candidates > 1 and args.stream:
+        parser.error("--stream cannot be combined with --candidates")
+    if args.verify and args.stream:
+        parser.error("--stream cannot be combined with --verify")
 
     try:
-        print("Initializing RAG pipeline...")
-        pipeline = MathematicalRAGPipeline(
-            model_name=args.model, textbook_path=args.textbook
-        )
+        client = FormalizationClient(args.server)
+        health = None if args.no_server else client.health()
+        if health is not None:
+            print(f"Using formalization server at {args.server}")
+            ignored = ignored_flags(args, health)
+            if ignored:
+                print(
+                    "Warning: the server's pipeline settings apply instead of "
+                    + "; ".join(ignored)
+                    + ". Pass --no-server to run with the local flags."
+                )
+            pipeline = client
+        else:
+            # Imported lazily so that server clients don't pay for torch/transformers
+            from src.application.rag import (
+                COMPONENTS,
+                GENERATION_COMPONENTS,
+                VERIFICATION_COMPONENTS,
+                MathematicalRAGPipeline,
+            )
 
-        if args.no_rag:
-            print(f"Generating Lean code without RAG for query: {args.query}")
-            lean_code = pipeline.formalize_without_rag(args.query)
+            print("Initializing RAG pipeline...")
+            pipeline = MathematicalRAGPipeline(
+                model_name=args.model,
+                textbook_path=args.textbook,
+                index_dir=args.index_dir,
+                chunker=args.chunker,
+                index_factory=args.index_factory,
+                index_search_params=args.index_search_params,
+                mathlib_index=args.mathlib_index,
+                mathlib_top_k=args.mathlib_top_k,
+                persist_retrieval_cache=args.retrieval_cache,
+                fusion=args.fusion,
+                reranker=args.reranker,
+                rerank_candidates=args.rerank_candidates,
+                rerank_budget_ms=args.rerank_budget_ms,
+                context_token_budget=args.context_tokens,
+                prefix_cache_mb=args.prefix_cache_mb,
+                stop_at_code_end=not args.no_early_stop,
+                draft_model=args.draft_model,
+                prompt_lookup_tokens=args.prompt_lookup,
+                precision=args.precision,
+                quantized_dir=args.quantized_dir,
+                lean_workers=args.lean_workers if args.verify else 0,
+                lean_timeout=args.lean_timeout,
+                num_candidates=args.candidates,
+                persist_verification_cache=args.verification_cache,
+                # Without RAG the embedding model and index are never loaded
+                preload=(
+                    GENERATION_COMPONENTS + VERIFICATION_COMPONENTS
+                    if args.no_rag
+                    else COMPONENTS
+                ),
+            )
+
+        if args.input:
+            run_batch(pipeline, args)
+            print_pipeline_stats(pipeline)
+            return
+
+        if args.stream:
+            method = "no_rag" if args.no_rag else args.method
+            context = (
+                None
+                if args.no_rag
+                else pipeline.retrieve_context(
+                    args.query, method=args.method, top_k=args.top_k
+                )
+            )
+            facts, _ = pipeline.retrieve_facts(args.query, method)
+            print(f"Streaming Lean code (method: {method}) for query: {args.query}\n")
+
+            pieces = []
+            for text in pipeline.stream_lean_code(args.query, context, facts=facts):
+                print(text, end="", flush=True)
+                pieces.append(text)
+            print()
 
             result = {
                 "query": args.query,
-                "method": "no_rag",
-                "lean_code": lean_code,
-                "context_used": None,
+                "method": method,
+                # Strip the fences and any prose, as the other modes do
+                "lean_code": extract_lean_code("".join(pieces)),
+                "context_used": context,
+                "facts_used": facts,
                 "metrics": None,
             }
+        elif args.no_rag:
+            print(f"Generating Lean code without RAG for query: {args.query}")
+            if args.verify:
+                lean_code, metrics = pipeline.formalize_with_rag(
+                    args.query, method="no_rag"
+                )
+                result = no_rag_result(args.query, lean_code, metrics.verification)
+            else:
+                lean_code = pipeline.formalize_without_rag(args.query)
+                result = no_rag_result(args.query, lean_code)
         else:
             print(
                 f"Generating Lean code with RAG (method: {args.method}) for query: {args.query}"
@@ -73,16 +535,10 @@ def main():
             lean_code, metrics = pipeline.formalize_with_rag(
                 args.query, method=args.method, top_k=args.top_k
             )
+            result = rag_result(args.query, args.method, lean_code, metrics)
 
-            result = {
-                "query": args.query,
-                "method": args.method,
-                "lean_code": lean_code,
-                "context_used": metrics.retrieved_contexts,
-                "metrics": None,
-            }
-
-        with open(args.output, "w") as f:
+        output = args.output or "output.json"
+        with open(output, "w") as f:
             json.dump(result, f, indent=2)
 
         print("\n" + "=" * 50)
@@ -90,14 +546,31 @@ def main():
         print("=" * 50)
         print(f"Query: {args.query}")
         print(f"Method: {result['method']}")
-        print(f"Generated Lean Code:\n{result['lean_code']}")
+        if not args.stream:
+            print(f"Generated Lean Code:\n{result['lean_code']}")
 
         if result["context_used"]:
             print(f"\nRetrieved Context ({len(result['context_used'])} chunks):")
             for i, context in enumerate(result["context_used"], 1):
                 print(f"{i}. {context[:200]}...")
 
-        print(f"\nResults saved to: {args.output}")
+        verification = result.get("verification")
+        if verification is not None:
+            if verification["error"]:
+                status = f"not checked ({verification['error']})"
+            elif verification["success"]:
+                status = "compiles" + (
+                    f" with {verification['sorries']} sorry" if verification["sorries"] else ""
+                )
+            else:
+                status = "fails to compile"
+            print(f"\nLean verification: {status} [{verification['seconds']:.2f}s]")
+            for message in verification["messages"]:
+                if message["severity"] == "error":
+                    print(f"  line {message['line']}: {message['text']}")
+
+        print_pipeline_stats(pipeline)
+        print(f"\nResults saved to: {output}")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+from src.application.client import DEFAULT_HOST, DEFAULT_PORT
+from src.application.rag import MathematicalRAGPipeline
+from src.application.server import FormalizationServer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep the formalization pipeline loaded and serve it over HTTP"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=DEFAULT_HOST,
+        help=f"Address to bind (default: {DEFAULT_HOST})",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on (default: {DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=8,
+        help="Concurrent requests decoded together by the scheduler; 0 serializes requests (default: 8)",
+    )
+    parser.add_argument(
+        "--textbook",
+        type=str,
+        default="dataset/converted.txt",
+        help="Path to textbook markdown file, or a directory of .md/.txt documents to index as one corpus (default: dataset/converted.txt)",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="deepseek-ai/DeepSeek-Prover-V2-7B",
+        help="HuggingFace model name",
+    )
+    parser.add_argument(
+        "--chunker",
+        type=str,
+        default="structured",
+        choices=["structured", "recursive"],
+        help="Split the textbook at headings and theorem/proof labels, or into fixed-size overlapping pieces (default: structured)",
+    )
+    parser.add_argument(
+        "--mathlib-index",
+        type=str,
+        default=None,
+        help="Index of Mathlib declarations built by build_mathlib_index.py; relevant facts are added to the prompt (default: none)",
+    )
+    parser.add_argument(
+        "--mathlib-top-k",
+        type=int,
+        default=5,
+        help="Number of Mathlib facts to retrieve with --mathlib-index (default: 5)",
+    )
+    parser.add_argument(
+        "--index-dir",
+        type=str,
+        default=None,
+        help="Directory for the persistent retrieval index (default: .rag_index/<textbook name>)",
+    )
+    parser.add_argument(
+        "--index-factory",
+        type=str,
+        default="Flat",
+        help="FAISS index for the textbook vectors, e.g. Flat (exact), IVF1024,PQ32 or HNSW32 (default: Flat); see benchmark_index.py",
+    )
+    parser.add_argument(
+        "--index-search-params",
+        type=str,
+        default=None,
+        help="FAISS search parameters for approximate indexes, e.g. nprobe=16 or efSearch=128",
+    )
+    parser.add_argument(
+        "--fusion",
+        type=str,
+        default="rrf",
+        choices=["rrf", "weighted"],
+        help="How hybrid retrieval combines BM25 and dense rankings (default: rrf)",
+    )
+    parser.add_argument(
+        "--reranker",
+        type=str,
+        default=None,
+        help="Cross-encoder used to rerank retrieved candidates, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 (default: no reranking)",
+    )
+    parser.add_argument(
+        "--rerank-candidates",
+        type=int,
+        default=50,
+        help="Number of first-stage candidates scored by the reranker (default: 50)",
+    )
+    parser.add_argument(
+        "--rerank-budget-ms",
+        type=float,
+        default=200.0,
+        help="Per-query reranking time budget; first-stage order is kept when exceeded (default: 200)",
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        help="Token budget for retrieved context in the prompt (default: whatever fits in 2048 prompt tokens)",
+    )
+    parser.add_argument(
+        "--prefix-cache-mb",
+        type=int,
+        default=0,
+        help="Memory cap for reusing key/values of shared prompt prefixes; 0 disables (default: 0)",
+    )
+    parser.add_argument(
+        "--no-early-stop",
+        action="store_true",
+        help="Keep generating after the Lean code block is complete (until EOS or the token limit)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default=None,
+        choices=["fp16", "bf16", "fp32", "int8", "int4"],
+        help="Prover weight precision; int8/int4 are CPU-only and converted once into --quantized-dir (default: fp16 on GPU, bf16 on CPU)",
+    )
+    parser.add_argument(
+        "--quantized-dir",
+        type=str,
+        default=".model_cache",
+        help="Directory for converted quantized weights (default: .model_cache)",
+    )
+    parser.add_argument(
+        "--draft-model",
+        type=str,
+        default=None,
+        help="Small model proposing tokens for the prover to verify (speculative decoding)",
+    )
+    parser.add_argument(
+        "--prompt-lookup",
+        type=int,
+        default=0,
+        help="Speculate this many tokens per step by n-gram lookup in the prompt; 0 disables (default: 0)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Type-check generated code with warm Lean REPL workers from repl/",
+    )
+    parser.add_argument(
+        "--lean-workers",
+        type=int,
+        default=2,
+        help="Lean REPL processes used with --verify (default: 2)",
+    )
+    parser.add_argument(
+        "--lean-timeout",
+        type=float,
+        default=60.0,
+        help="Per-check Lean timeout in seconds (default: 60)",
+    )
+    parser.add_argument(
+        "--verification-cache",
+        action="store_true",
+        help="Keep Lean check results in repl/.lake across runs (they are always cached in memory)",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="With --verify, sample this many candidates in one batch and keep the first that compiles (default: 1)",
+    )
+    parser.add_argument(
+        "--retrieval-cache",
+        action="store_true",
+        help="Keep cached query embeddings and rankings in the index directory across runs",
+    )
+
+    args = parser.parse_args()
+    if args.candidates > 1 and not args.verify:
+        parser.error("--candidates needs --verify")
+
+    try:
+        print("Initializing RAG pipeline...")
+        pipeline = MathematicalRAGPipeline(
+            model_name=args.model,
+            textbook_path=args.textbook,
+            index_dir=args.index_dir,
+            chunker=args.chunker,
+            index_factory=args.index_factory,
+            index_search_params=args.index_search_params,
+            mathlib_index=args.mathlib_index,
+            mathlib_top_k=args.mathlib_top_k,
+            persist_retrieval_cache=args.retrieval_cache,
+            fusion=args.fusion,
+            reranker=args.reranker,
+            rerank_candidates=args.rerank_candidates,
+            rerank_budget_ms=args.rerank_budget_ms,
+            context_token_budget=args.context_tokens,
+            prefix_cache_mb=args.prefix_cache_mb,
+            stop_at_code_end=not args.no_early_stop,
+            draft_model=args.draft_model,
+            prompt_lookup_tokens=args.prompt_lookup,
+            precision=args.precision,
+            quantized_dir=args.quantized_dir,
+            lean_workers=args.lean_workers if args.verify else 0,
+            lean_timeout=args.lean_timeout,
+            num_candidates=args.candidates,
+            persist_verification_cache=args.verification_cache,
+        )
+        server = FormalizationServer(
+            pipeline,
+            host=args.host,
+            port=args.port,
+            max_batch_size=args.max_batch_size,
+        )
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+import faiss
+
+# Vectors used to train IVF centroids and PQ/SQ codebooks. Training cost
+# grows with the sample, and a few hundred points per centroid is enough.
+TRAIN_SAMPLE_SIZE = 65536
+
+# Search-time settings swept by benchmark_index.py
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 64, 256)
+
+
+def train_sample(vectors: np.ndarray, size: int = TRAIN_SAMPLE_SIZE, seed: int = 0) -> np.ndarray:
+    """A fixed random subset of ``vectors`` (all of them if there are fewer)."""
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def new_faiss_index(
+    vectors: np.ndarray,
+    index_factory: str = "Flat",
+    train_size: int = TRAIN_SAMPLE_SIZE,
+):
+    """An empty FAISS index for ``index_factory``, trained on a sample of ``vectors``.
+
+    ``index_factory`` is a FAISS factory string: "Flat" (exact), "SQ8",
+    "IVF1024,PQ32", "HNSW32", ... Raises ValueError when there are too few
+    vectors to train it.
+    """
+    try:
+        index = faiss.index_factory(vectors.shape[1], index_factory, faiss.METRIC_L2)
+    except RuntimeError as e:
+        raise ValueError(f"Invalid FAISS index factory {index_factory!r}: {e}") from e
+    if not index.is_trained:
+        try:
+            index.train(train_sample(vectors, train_size))
+        except RuntimeError as e:
+            raise ValueError(
+                f"Cannot train a {index_factory} index on {len(vectors)} vectors; "
+                "use Flat or fewer IVF lists / PQ bits"
+            ) from e
+    return index
+
+
+def supports_removal(index_factory: str) -> bool:
+    """Whether an IndexIDMap2 over this index can drop and renumber vectors.
+
+    Only flat-code indexes (Flat, SQ, PQ) compact their storage in step
+    with the id map. IVF lists keep their own ids, which then drift from
+    the renumbered map, and HNSW graphs cannot drop vectors at all.
+    """
+    return "IVF" not in index_factory and "HNSW" not in index_factory
+
+
+def mmap_io_flags(index_factory: str) -> int:
+    """``faiss.read_index`` flags that memory-map an index of this type.
+
+    IO_FLAG_MMAP only maps IVF inverted lists; flat codes, SQ/PQ codes and
+    HNSW storage need IO_FLAG_MMAP_IFC, which in turn rejects IVF lists.
+    """
+    if "IVF" in index_factory:
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def set_search_params(index, params: Optional[str]) -> List[str]:
+    """Apply FAISS search parameters such as "nprobe=16,efSearch=64".
+
+    Parameters the index does not have (e.g. nprobe on an HNSW index) are
+    skipped, so one setting can be applied to several indexes. Returns the
+    names that were applied.
+    """
+    if not params:
+        return []
+    space = faiss.ParameterSpace()
+    applied = []
+    for item in params.split(","):
+        name, _, value = item.partition("=")
+        if not value:
+            raise ValueError(f"Expected name=value in search parameters, got {item!r}")
+        try:
+            space.set_index_parameter(index, name.strip(), float(value))
+        except RuntimeError:
+            continue
+        applied.append(name.strip())
+    return applied
+
+
+def search_sweep(index_factory: str) -> List[str]:
+    """Search parameter settings to benchmark for an index factory."""
+    if "IVF" in index_factory:
+        nlist = int(re.search(r"IVF(\d+)", index_factory).group(1))
+        return [f"nprobe={n}" for n in NPROBE_SWEEP if n <= nlist]
+    if "HNSW" in index_factory:
+        return [f"efSearch={ef}" for ef in EF_SEARCH_SWEEP]
+    return [""]
+
+
+def default_factories(num_vectors: int, dim: int) -> List[str]:
+    """IVF-Flat, IVF-PQ and HNSW factories sized for ``num_vectors``.
+
+    About 4 * sqrt(n) IVF lists (a power of two), and PQ with one byte per
+    four dimensions.
+    """
+    nlist = 1 << max(4, int(np.log2(max(1.0, 4 * np.sqrt(num_vectors)))))
+    factories = [f"IVF{nlist},Flat"]
+    if dim % 4 == 0:
+        factories.append(f"IVF{nlist},PQ{dim // 4}")
+    factories.append("HNSW32")
+    return factories
+
+
+def recall_at_k(approximate: np.ndarray, exact: np.ndarray) -> float:
+    """Mean fraction of the exact top-k ids that the approximate search found."""
+    k = exact.shape[1]
+    return float(
+        np.mean([len(set(a) & set(e)) / k for a, e in zip(approximate, exact)])
+    )
+
+
+def index_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {"mean_ms": float(ms.mean()), "p95_ms": float(np.percentile(ms, 95))}
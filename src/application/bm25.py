@@ -0,0 +1,181 @@
+import os
+import json
+from collections import Counter
+from typing import List, Dict, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().split()
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the ``top_k`` largest scores, best first.
+
+    Uses ``argpartition`` so only the selected candidates are sorted.
+    """
+    top_k = min(top_k, scores.shape[0])
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def term_counts(
+    tokenized_docs: List[List[str]], vocabulary: Dict[str, int]
+) -> sparse.csr_matrix:
+    """Term-document count matrix; unseen terms are added to ``vocabulary``."""
+    rows, cols, tfs = [], [], []
+    for doc_id, tokens in enumerate(tokenized_docs):
+        for term, tf in Counter(tokens).items():
+            rows.append(vocabulary.setdefault(term, len(vocabulary)))
+            cols.append(doc_id)
+            tfs.append(tf)
+    return sparse.csr_matrix(
+        (
+            np.asarray(tfs, dtype=np.float32),
+            (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)),
+        ),
+        shape=(len(vocabulary), len(tokenized_docs)),
+    )
+
+
+def save_csr(directory: str, matrix: sparse.csr_matrix):
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "data.npy"), matrix.data)
+    np.save(os.path.join(directory, "indices.npy"), matrix.indices)
+    np.save(os.path.join(directory, "indptr.npy"), matrix.indptr)
+
+
+def load_csr(directory: str, shape: Tuple[int, int], mmap: bool = True) -> sparse.csr_matrix:
+    mmap_mode = "r" if mmap else None
+    return sparse.csr_matrix(
+        (
+            np.load(os.path.join(directory, "data.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "indices.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "indptr.npy"), mmap_mode=mmap_mode),
+        ),
+        shape=shape,
+    )
+
+
+class SparseBM25:
+    """Okapi BM25 over a precomputed CSR term-document weight matrix.
+
+    Every (term, document) entry already holds
+    ``idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl))``, so
+    scoring a query is a single sparse vector-matrix product and scoring a
+    batch of queries is a single sparse matrix product. IDF follows
+    ``rank_bm25.BM25Okapi``, including its epsilon floor for terms that
+    occur in more than half of the documents.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], weights: sparse.csr_matrix):
+        self.vocabulary = vocabulary
+        self.weights = weights
+
+    @property
+    def num_documents(self) -> int:
+        return self.weights.shape[1]
+
+    @classmethod
+    def build(
+        cls,
+        tokenized_docs: List[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> "SparseBM25":
+        vocabulary: Dict[str, int] = {}
+        counts = term_counts(tokenized_docs, vocabulary)
+        return cls.from_counts(vocabulary, counts, k1, b, epsilon)
+
+    @classmethod
+    def from_counts(
+        cls,
+        vocabulary: Dict[str, int],
+        counts: sparse.spmatrix,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> "SparseBM25":
+        """Weights from a term-document count matrix.
+
+        Lets an index that keeps its counts recompute IDF and length
+        normalization after adding or removing documents without
+        re-tokenizing the unchanged ones.
+        """
+        counts = sparse.coo_matrix(counts)
+        num_docs = counts.shape[1]
+        rows = counts.row.astype(np.int64)
+        cols = counts.col.astype(np.int64)
+        tfs = counts.data.astype(np.float32)
+        doc_lens = np.asarray(counts.sum(axis=0), dtype=np.float32).ravel()
+
+        doc_freqs = np.bincount(rows, minlength=len(vocabulary)).astype(np.float64)
+        idf = np.log(num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        average_idf = idf.mean() if len(idf) else 0.0
+        idf[idf < 0] = epsilon * average_idf
+
+        avgdl = doc_lens.mean() if num_docs else 0.0
+        norm = k1 * (1 - b + b * doc_lens / max(avgdl, 1e-9))
+        data = idf[rows] * tfs * (k1 + 1) / (tfs + norm[cols])
+
+        weights = sparse.csr_matrix(
+            (data.astype(np.float32), (rows, cols)),
+            shape=(len(vocabulary), num_docs),
+        )
+        return cls(vocabulary, weights)
+
+    def _query_matrix(self, tokenized_queries: List[List[str]]) -> sparse.csr_matrix:
+        rows, cols = [], []
+        for row, tokens in enumerate(tokenized_queries):
+            for token in tokens:
+                term = self.vocabulary.get(token)
+                if term is not None:
+                    rows.append(row)
+                    cols.append(term)
+        # Duplicate (row, col) pairs are summed, so repeated query terms count
+        # multiple times just like in BM25Okapi.get_scores.
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(tokenized_queries), len(self.vocabulary)),
+        )
+
+    def get_scores(self, tokenized_query: List[str]) -> np.ndarray:
+        return self.get_scores_batch([tokenized_query])[0]
+
+    def get_scores_batch(self, tokenized_queries: List[List[str]]) -> np.ndarray:
+        scores = self._query_matrix(tokenized_queries) @ self.weights
+        return scores.toarray()
+
+    def top_k(self, tokenized_query: List[str], top_k: int) -> List[Tuple[int, float]]:
+        return self.top_k_batch([tokenized_query], top_k)[0]
+
+    def top_k_batch(
+        self, tokenized_queries: List[List[str]], top_k: int
+    ) -> List[List[Tuple[int, float]]]:
+        scores = self.get_scores_batch(tokenized_queries)
+        results = []
+        for row in scores:
+            indices = top_k_indices(row, top_k)
+            results.append([(int(i), float(row[i])) for i in indices])
+        return results
+
+    def save(self, directory: str):
+        save_csr(directory, self.weights)
+        with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"shape": list(self.weights.shape), "vocabulary": self.vocabulary},
+                f,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "SparseBM25":
+        with open(os.path.join(directory, "vocabulary.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        weights = load_csr(directory, tuple(meta["shape"]), mmap=mmap)
+        return cls(meta["vocabulary"], weights)
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import List, Optional, Hashable, Tuple
+
+import numpy as np
+
+from src.entity.verification import VerificationResult, verification_from_dict
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+
+    def get(self, key: Hashable):
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key: Hashable, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RetrievalCache:
+    """Caches query embeddings and scored chunk rankings for retrieval.
+
+    Entries live in an in-memory LRU and, when ``path`` is given, in a
+    SQLite file so they survive across runs. Everything is tied to
+    ``content_hash``, which should identify the index contents, the
+    embedding model and the FAISS search settings: opening the cache
+    against a different index drops the stale entries.
+    """
+
+    def __init__(
+        self, content_hash: str, path: Optional[str] = None, max_size: int = 1024
+    ):
+        self.content_hash = content_hash
+        self.path = path
+        self._embeddings = LRUCache(max_size)
+        self._rankings = LRUCache(max_size)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.embedding_hits = 0
+        self.embedding_misses = 0
+        self.ranking_hits = 0
+        self.ranking_misses = 0
+
+        if path is not None:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS embeddings (query TEXT PRIMARY KEY, vector BLOB);
+            CREATE TABLE IF NOT EXISTS scored_rankings (
+                query TEXT, method TEXT, top_k INTEGER, results TEXT,
+                PRIMARY KEY (query, method, top_k)
+            );
+            """
+        )
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'content_hash'"
+        ).fetchone()
+        if row is None or row[0] != self.content_hash:
+            # Rankings refer to chunk ids of a different index and the
+            # embeddings may come from a different model
+            self._db.execute("DELETE FROM embeddings")
+            self._db.execute("DELETE FROM scored_rankings")
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('content_hash', ?)",
+                (self.content_hash,),
+            )
+        self._db.commit()
+
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._embeddings.get(query)
+            if vector is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE query = ?", (query,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._embeddings.put(query, vector)
+            if vector is None:
+                self.embedding_misses += 1
+            else:
+                self.embedding_hits += 1
+            return vector
+
+    def put_embedding(self, query: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._embeddings.put(query, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    (query, vector.tobytes()),
+                )
+                self._db.commit()
+        return vector
+
+    def get_ranking(
+        self, query: str, method: str, top_k: int
+    ) -> Optional[List[Tuple[int, float]]]:
+        key = (query, method, top_k)
+        with self._lock:
+            results = self._rankings.get(key)
+            if results is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT results FROM scored_rankings "
+                    "WHERE query = ? AND method = ? AND top_k = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    results = [(int(i), float(score)) for i, score in json.loads(row[0])]
+                    self._rankings.put(key, results)
+            if results is None:
+                self.ranking_misses += 1
+            else:
+                self.ranking_hits += 1
+            return results
+
+    def put_ranking(
+        self, query: str, method: str, top_k: int, results: List[Tuple[int, float]]
+    ):
+        key = (query, method, top_k)
+        results = [(int(i), float(score)) for i, score in results]
+        with self._lock:
+            self._rankings.put(key, results)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO scored_rankings VALUES (?, ?, ?, ?)",
+                    key + (json.dumps(results),),
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "embedding_hits": self.embedding_hits,
+            "embedding_misses": self.embedding_misses,
+            "ranking_hits": self.ranking_hits,
+            "ranking_misses": self.ranking_misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.clear()
+            self._rankings.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.execute("DELETE FROM scored_rankings")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class VerificationCache:
+    """Content-addressed cache of Lean check results.
+
+    Entries are keyed by a hash of the normalized source and ``environment``
+    (toolchain, package revisions and header), so results from a different
+    Lean or Mathlib never match. They live in an in-memory LRU and, when
+    ``path`` is given, in a SQLite file shared across runs.
+    """
+
+    def __init__(
+        self, environment: str, path: Optional[str] = None, max_size: int = 4096
+    ):
+        self.environment = environment
+        self.path = path
+        self._results = LRUCache(max_size)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def cacheable(result: VerificationResult) -> bool:
+        # Timeouts, cancellations and REPL failures say nothing about the code
+        return result.error is None and not result.timed_out
+
+    def key(self, source: str) -> str:
+        return hashlib.sha256(
+            f"{self.environment}\n{source}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, source: str) -> Optional[VerificationResult]:
+        key = self.key(source)
+        with self._lock:
+            result = self._results.get(key)
+            if result is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT result FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    result = verification_from_dict(json.loads(row[0]))
+                    self._results.put(key, result)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, source: str, result: VerificationResult):
+        key = self.key(source)
+        with self._lock:
+            self._results.put(key, result)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?)",
+                    (key, json.dumps(asdict(result))),
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
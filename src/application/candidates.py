@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import StoppingCriteria
+
+from src.application.lean_code import GeneratedText
+from src.application.verification import LeanVerifier
+from src.entity.verification import VerificationResult
+
+
+class CandidateChecker(StoppingCriteria):
+    """Type-checks sampled candidates while the batch is still decoding.
+
+    Used as a stopping criterion for a ``num_return_sequences`` generation.
+    Each row is sent to the verifier as soon as its Lean code is complete
+    (or it emits EOS). The first candidate to compile wins. Every row is
+    then stopped at the next decode step, and the checks still waiting for
+    or holding a worker are cancelled.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        verifier: LeanVerifier,
+        prompt_length: int,
+        num_candidates: int,
+        stop_at_code_end: bool = True,
+    ):
+        self.tokenizer = tokenizer
+        self.verifier = verifier
+        self.prompt_length = prompt_length
+        self.stop_at_code_end = stop_at_code_end
+        self.cancel = threading.Event()
+        self.rows: List[GeneratedText] = []
+        # Generated tokens already passed to the rows
+        self.consumed = 0
+        self.winner: Optional[int] = None
+        # row -> result, in the order the checks finished
+        self.results: Dict[int, VerificationResult] = {}
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_candidates, thread_name_prefix="candidate"
+        )
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        if not self.rows:
+            self.rows = [GeneratedText(self.tokenizer) for _ in range(input_ids.shape[0])]
+        new_tokens: List[List[int]] = input_ids[
+            :, self.prompt_length + self.consumed :
+        ].tolist()
+        self.consumed += len(new_tokens[0])
+        complete = []
+        for row, (text, tokens) in enumerate(zip(self.rows, new_tokens)):
+            text.extend(tokens)
+            if (text.complete or text.ended) and row not in self._futures:
+                # Decoded in full once, so the check sees the exact text
+                generated = input_ids[row, self.prompt_length :].tolist()
+                self.submit(
+                    row, self.tokenizer.decode(generated, skip_special_tokens=True)
+                )
+            complete.append(text.complete and self.stop_at_code_end)
+        if self.cancel.is_set():
+            return torch.ones(len(self.rows), dtype=torch.bool, device=input_ids.device)
+        return torch.tensor(complete, dtype=torch.bool, device=input_ids.device)
+
+    def submit(self, row: int, text: str):
+        """Start checking a row, unless it is already checked or decided."""
+        with self._lock:
+            if row in self._futures or self.cancel.is_set():
+                return
+            self._futures[row] = self._executor.submit(self._check, row, text)
+
+    def _check(self, row: int, text: str) -> VerificationResult:
+        result = self.verifier.verify(text, cancel=self.cancel)
+        with self._lock:
+            self.results[row] = result
+            if result.success and self.winner is None:
+                self.winner = row
+                self.cancel.set()
+        return result
+
+    def finish(self, texts: List[str]) -> Tuple[int, VerificationResult]:
+        """Check the rows generation left unchecked and pick the answer.
+
+        Returns the winning row, or the row with the fewest errors when no
+        candidate compiles.
+        """
+        for row, text in enumerate(texts):
+            self.submit(row, text)
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures)
+        self._executor.shutdown(wait=False)
+
+        if self.winner is not None:
+            return self.winner, self.results[self.winner]
+        finished = list(self.results)
+        row = min(
+            finished,
+            key=lambda r: (
+                self.results[r].error is not None,
+                len(self.results[r].errors),
+                finished.index(r),
+            ),
+        )
+        return row, self.results[row]
+
+    def abandon(self):
+        """Cancel every check, e.g. when generation failed or timed out."""
+        self.cancel.set()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def checked(self) -> int:
+        """Candidates whose check ran to completion (not cancelled)."""
+        with self._lock:
+            return sum(r.error != "Cancelled" for r in self.results.values())
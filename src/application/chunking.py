@@ -0,0 +1,131 @@
+import re
+from typing import List, Optional, Tuple
+
+from src.entity.chunk import TextChunk
+
+HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# "**Theorem 2.1.1 (Uniqueness of Limits):**", "**Proof:**", "**A1.**"
+LABEL = re.compile(r"^\*\*([^*\n]+?)[:.]?\*\*")
+
+# Labelled blocks that are kept whole, together with a following proof
+STATEMENT_KINDS = (
+    "theorem",
+    "lemma",
+    "proposition",
+    "corollary",
+    "definition",
+    "example",
+    "exercise",
+)
+PROOF_KINDS = ("proof",)
+
+
+def label_kind(label: str) -> Optional[str]:
+    """Block kind of a bold label, or None for other labels (e.g. axioms)."""
+    word = label.split(maxsplit=1)[0].lower() if label.strip() else ""
+    if word in STATEMENT_KINDS or word in PROOF_KINDS:
+        return word
+    return None
+
+
+class StructuredChunker:
+    """Splits a markdown textbook along its own structure in one pass.
+
+    Markdown headings close the current block and set the heading path
+    stored with each chunk. A bold ``**Theorem ...**``-style label starts a
+    block that runs, including a following ``**Proof:**``, until the next
+    heading or label; it is kept whole up to ``max_block_chars``. Prose
+    between labelled blocks forms text blocks, split at paragraph
+    boundaries to stay under ``max_chars``. Chunks do not overlap; each
+    starts with its section heading so it reads on its own.
+    """
+
+    def __init__(self, max_chars: int = 1500, max_block_chars: int = 4000):
+        self.max_chars = max_chars
+        self.max_block_chars = max_block_chars
+
+    @property
+    def chunker_id(self) -> str:
+        return f"structured:1:{self.max_chars}:{self.max_block_chars}"
+
+    def split(self, content: str) -> List[TextChunk]:
+        chunks: List[TextChunk] = []
+        # (level, title) of the enclosing headings
+        headings: List[Tuple[int, str]] = []
+        block: List[str] = []
+        kind, label, start = "text", None, 1
+        has_proof = False
+
+        def close():
+            if any(line.strip() for line in block):
+                chunks.extend(
+                    self._emit(block, [t for _, t in headings], kind, label, start)
+                )
+            block.clear()
+
+        for number, line in enumerate(content.splitlines(), start=1):
+            heading = HEADING.match(line)
+            if heading is not None:
+                close()
+                level = len(heading.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, heading.group(2)))
+                kind, label, start, has_proof = "text", None, number + 1, False
+                continue
+
+            labelled = LABEL.match(line)
+            new_kind = label_kind(labelled.group(1)) if labelled else None
+            if new_kind in PROOF_KINDS and kind in STATEMENT_KINDS and not has_proof:
+                has_proof = True
+            elif new_kind is not None:
+                close()
+                kind, label, start, has_proof = new_kind, labelled.group(1).strip(), number, False
+            elif labelled is not None and kind != "text":
+                # An unrecognized label (e.g. an axiom) ends a theorem block
+                close()
+                kind, label, start, has_proof = "text", None, number, False
+            if not block and not line.strip():
+                start = number + 1
+                continue
+            block.append(line)
+        close()
+        return chunks
+
+    def _emit(
+        self,
+        lines: List[str],
+        headings: List[str],
+        kind: str,
+        label: Optional[str],
+        start: int,
+    ) -> List[TextChunk]:
+        prefix = f"{headings[-1]}\n\n" if headings else ""
+        text = "\n".join(lines).strip()
+        limit = self.max_block_chars if kind != "text" else self.max_chars
+        pieces = [text] if len(text) <= limit else self._split_paragraphs(text, limit)
+        return [
+            TextChunk(
+                text=prefix + piece,
+                headings=list(headings),
+                kind=kind,
+                label=label if i == 0 or label is None else f"{label} (cont.)",
+                start_line=start,
+            )
+            for i, piece in enumerate(pieces)
+        ]
+
+    @staticmethod
+    def _split_paragraphs(text: str, limit: int) -> List[str]:
+        # Greedy packing of whole paragraphs; a single oversized paragraph
+        # becomes its own piece rather than being cut mid-sentence.
+        pieces, current = [], ""
+        for paragraph in re.split(r"\n\s*\n", text):
+            if current and len(current) + 2 + len(paragraph) > limit:
+                pieces.append(current)
+                current = paragraph
+            else:
+                current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            pieces.append(current)
+        return pieces
@@ -0,0 +1,122 @@
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from src.entity.metrics import RAGMetrics
+from src.entity.verification import verification_from_dict
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SERVER_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+def metrics_from_dict(data: dict) -> RAGMetrics:
+    data = dict(data)
+    # JSON object keys are always strings
+    data["top_k_recall"] = {int(k): v for k, v in data["top_k_recall"].items()}
+    if data.get("verification") is not None:
+        data["verification"] = verification_from_dict(data["verification"])
+    return RAGMetrics(**data)
+
+
+class FormalizationClient:
+    """Thin client exposing the pipeline's formalize/retrieve/stream API."""
+
+    def __init__(self, url: str = DEFAULT_SERVER_URL, timeout: float = 3600.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: dict = None, timeout: float = None) -> dict:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            self.url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read()).get("error", str(e))) from e
+
+    def health(self) -> Optional[dict]:
+        """The server's /health response, or None if it is unreachable or unhealthy."""
+        try:
+            response = self._request("/health", timeout=1.0)
+        except (OSError, ValueError, RuntimeError):
+            # RuntimeError: the server answered with an HTTP error
+            return None
+        return response if response.get("status") == "ok" else None
+
+    def is_available(self) -> bool:
+        return self.health() is not None
+
+    def formalize_with_rag(
+        self, query: str, method: str = "hybrid", top_k: int = 5
+    ) -> Tuple[str, RAGMetrics]:
+        response = self._request(
+            "/formalize_with_rag",
+            {"query": query, "method": method, "top_k": top_k},
+        )
+        return response["lean_code"], metrics_from_dict(response["metrics"])
+
+    def formalize_without_rag(self, query: str) -> str:
+        return self._request("/formalize_without_rag", {"query": query})["lean_code"]
+
+    # Batches are sent as concurrent requests so that the server's scheduler
+    # can decode them together.
+
+    def formalize_batch(
+        self, queries: List[str], method: str = "hybrid", top_k: int = 5
+    ) -> List[Tuple[str, RAGMetrics]]:
+        with ThreadPoolExecutor(max_workers=max(len(queries), 1)) as executor:
+            return list(
+                executor.map(lambda q: self.formalize_with_rag(q, method, top_k), queries)
+            )
+
+    def generate_lean_code_batch(self, queries: List[str]) -> List[str]:
+        with ThreadPoolExecutor(max_workers=max(len(queries), 1)) as executor:
+            return list(executor.map(self.formalize_without_rag, queries))
+
+    def retrieve_context(
+        self,
+        query: str,
+        method: str = "hybrid",
+        top_k: int = 5,
+        source: str = "textbook",
+    ) -> List[str]:
+        response = self._request(
+            "/retrieve_context",
+            {"query": query, "method": method, "top_k": top_k, "source": source},
+        )
+        return response["context"]
+
+    def retrieve_facts(self, query: str, method: str = "hybrid") -> Tuple[List[str], float]:
+        response = self._request("/retrieve_facts", {"query": query, "method": method})
+        return response["facts"], response["seconds"]
+
+    def stream_lean_code(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        facts: Optional[List[str]] = None,
+    ) -> Iterator[str]:
+        payload = {"query": query, "context": context, "facts": facts}
+        request = urllib.request.Request(
+            self.url + "/stream_lean_code",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                for line in r:
+                    event = json.loads(line)
+                    if "error" in event:
+                        raise RuntimeError(event["error"])
+                    if event.get("done"):
+                        return
+                    yield event["text"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read()).get("error", str(e))) from e
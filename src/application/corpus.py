@@ -0,0 +1,304 @@
+import os
+import json
+import hashlib
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import faiss
+from scipy import sparse
+from src.application.ann import new_faiss_index, supports_removal
+from src.application.bm25 import SparseBM25, load_csr, save_csr, term_counts, tokenize
+from src.application.index import (
+    INDEX_VERSION,
+    IndexMetadata,
+    RetrievalIndex,
+    compute_content_hash,
+)
+from src.entity.chunk import TextChunk
+
+DOCUMENT_EXTENSIONS = (".md", ".txt")
+
+DOCUMENTS_FILE = "documents.json"
+COUNTS_DIR = "bm25_counts"
+
+
+def scan_documents(corpus_dir: str) -> Dict[str, str]:
+    """Relative path -> content hash of every document under ``corpus_dir``.
+
+    Files with the same contents as an earlier one (e.g. a ``.md`` and a
+    ``.txt`` export of the same book) are only indexed once.
+    """
+    documents: Dict[str, str] = {}
+    seen: Dict[str, str] = {}
+    for root, dirs, files in os.walk(corpus_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.endswith(DOCUMENT_EXTENSIONS):
+                continue
+            path = os.path.relpath(os.path.join(root, name), corpus_dir)
+            digest = compute_content_hash(os.path.join(corpus_dir, path), "")
+            if digest in seen:
+                print(f"Skipping {path}: same contents as {seen[digest]}")
+                continue
+            seen[digest] = path
+            documents[path] = digest
+    return documents
+
+
+def corpus_hash(documents: Dict[str, str], chunker_id: str) -> str:
+    digest = hashlib.sha256(chunker_id.encode("utf-8"))
+    for path in sorted(documents):
+        digest.update(f"\n{path}\0{documents[path]}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CorpusIndex(RetrievalIndex):
+    """Retrieval index over a directory of documents, updated incrementally.
+
+    A content hash is recorded per document. ``load_or_update`` re-chunks
+    and re-embeds only added or modified documents. Their vectors are
+    appended to the FAISS index, and the vectors of modified or deleted
+    documents are removed by id. BM25 keeps its raw term counts, so IDF and
+    length statistics are recomputed without re-tokenizing unchanged
+    chunks. Chunk ids stay dense: surviving chunks keep their relative order
+    and new chunks are appended. An index that needs training (SQ, PQ) is
+    trained when it is first built and keeps its codebooks across updates.
+    """
+
+    def __init__(
+        self,
+        chunks: List[str],
+        faiss_index,
+        bm25: SparseBM25,
+        metadata: IndexMetadata,
+        chunk_info: List[Dict[str, Any]],
+        counts: sparse.csr_matrix,
+        documents: Dict[str, str],
+        chunker_id: str,
+    ):
+        super().__init__(chunks, faiss_index, bm25, metadata, chunk_info)
+        # Terms x chunks, in the vocabulary of ``bm25``
+        self.counts = counts
+        self.documents = documents
+        self.chunker_id = chunker_id
+
+    @classmethod
+    def empty(
+        cls,
+        chunker_id: str,
+        embedding_model: str,
+        corpus_dir: str,
+        index_factory: str = "Flat",
+    ) -> "CorpusIndex":
+        metadata = IndexMetadata(
+            version=INDEX_VERSION,
+            embedding_model=embedding_model,
+            content_hash="",
+            num_chunks=0,
+            source_path=corpus_dir,
+            index_factory=index_factory,
+        )
+        return cls(
+            [],
+            None,
+            SparseBM25({}, sparse.csr_matrix((0, 0), dtype=np.float32)),
+            metadata,
+            [],
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            {},
+            chunker_id,
+        )
+
+    def _save_files(self, index_dir: str):
+        super()._save_files(index_dir)
+        save_csr(os.path.join(index_dir, COUNTS_DIR), self.counts)
+        with open(os.path.join(index_dir, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {"chunker_id": self.chunker_id, "documents": self.documents},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    @staticmethod
+    def read_documents(index_dir: str) -> Optional[dict]:
+        path = os.path.join(index_dir, DOCUMENTS_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "CorpusIndex":
+        base = RetrievalIndex.load(index_dir, mmap=mmap)
+        state = cls.read_documents(index_dir)
+        if state is None:
+            raise FileNotFoundError(f"No corpus index found at {index_dir}")
+        counts = load_csr(
+            os.path.join(index_dir, COUNTS_DIR),
+            (len(base.bm25.vocabulary), len(base.chunks)),
+            mmap=mmap,
+        )
+        return cls(
+            base.chunks,
+            base.faiss_index,
+            base.bm25,
+            base.metadata,
+            base.chunk_info,
+            counts,
+            state["documents"],
+            state["chunker_id"],
+        )
+
+    @classmethod
+    def load_or_update(
+        cls,
+        index_dir: str,
+        corpus_dir: str,
+        chunker: Callable[[str], List[TextChunk]],
+        chunker_id: str,
+        get_embeddings: Callable[[], Any],
+        embedding_model: str,
+        index_factory: str = "Flat",
+    ) -> "CorpusIndex":
+        """Load the index for ``corpus_dir``, first applying any document changes.
+
+        The index is rebuilt from scratch only when the embedding model, the
+        chunker, the FAISS index factory or the index format changed.
+        """
+        if not supports_removal(index_factory):
+            raise ValueError(
+                f"A {index_factory} index cannot remove the vectors of modified "
+                "documents; use Flat, SQ or PQ for a corpus directory"
+            )
+        if not os.path.isdir(corpus_dir):
+            raise FileNotFoundError(f"Corpus directory not found at {corpus_dir}")
+        documents = scan_documents(corpus_dir)
+        if not documents:
+            raise FileNotFoundError(
+                f"No documents ({', '.join(DOCUMENT_EXTENSIONS)}) found in {corpus_dir}"
+            )
+
+        content_hash = corpus_hash(documents, chunker_id)
+        metadata = cls.read_metadata(index_dir)
+        state = cls.read_documents(index_dir)
+        compatible = (
+            metadata is not None
+            and state is not None
+            and metadata.version == INDEX_VERSION
+            and metadata.embedding_model == embedding_model
+            and metadata.index_factory == index_factory
+            and state.get("chunker_id") == chunker_id
+        )
+        if compatible and metadata.content_hash == content_hash:
+            print(f"Loading corpus index from {index_dir}")
+            return cls.load(index_dir)
+
+        if compatible:
+            index = cls.load(index_dir, mmap=False)
+        else:
+            print(f"Building corpus index in {index_dir}")
+            index = cls.empty(chunker_id, embedding_model, corpus_dir, index_factory)
+        index.update(corpus_dir, documents, chunker, get_embeddings)
+        index.metadata = IndexMetadata(
+            version=INDEX_VERSION,
+            embedding_model=embedding_model,
+            content_hash=content_hash,
+            num_chunks=len(index.chunks),
+            source_path=corpus_dir,
+            index_factory=index_factory,
+        )
+        index.save(index_dir)
+        return index
+
+    def update(
+        self,
+        corpus_dir: str,
+        documents: Dict[str, str],
+        chunker: Callable[[str], List[TextChunk]],
+        get_embeddings: Callable[[], Any],
+    ):
+        """Bring the index in line with ``documents`` (path -> content hash)."""
+        changed = [p for p, digest in documents.items() if self.documents.get(p) != digest]
+        stale = {p for p, digest in self.documents.items() if documents.get(p) != digest}
+        print(
+            f"Corpus changes: {len(set(changed) - stale)} added, "
+            f"{len(stale & set(changed))} modified, {len(stale - set(changed))} deleted, "
+            f"{len(documents) - len(changed)} unchanged"
+        )
+
+        keep = [i for i, info in enumerate(self.chunk_info) if info.get("source") not in stale]
+        removed = [i for i, info in enumerate(self.chunk_info) if info.get("source") in stale]
+
+        new_chunks: List[TextChunk] = []
+        sources: List[str] = []
+        for path in changed:
+            with open(os.path.join(corpus_dir, path), "r", encoding="utf-8") as f:
+                chunks = chunker(f.read())
+            new_chunks.extend(chunks)
+            sources.extend([path] * len(chunks))
+        texts = [chunk.text for chunk in new_chunks]
+
+        self._update_vectors(keep, removed, texts, get_embeddings)
+        self._update_bm25(keep, texts)
+        self.chunks = [self.chunks[i] for i in keep] + texts
+        self.chunk_info = [self.chunk_info[i] for i in keep] + [
+            {**{k: v for k, v in asdict(chunk).items() if k != "text"}, "source": source}
+            for chunk, source in zip(new_chunks, sources)
+        ]
+        self.documents = dict(documents)
+
+    def _update_vectors(
+        self,
+        keep: List[int],
+        removed: List[int],
+        texts: List[str],
+        get_embeddings: Callable[[], Any],
+    ):
+        vectors = None
+        if texts:
+            print(f"Embedding {len(texts)} new chunks")
+            vectors = np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+        if self.faiss_index is None:
+            if vectors is None:
+                return
+            self.faiss_index = faiss.IndexIDMap2(
+                new_faiss_index(vectors, self.metadata.index_factory)
+            )
+
+        if removed:
+            self.faiss_index.remove_ids(np.asarray(removed, dtype=np.int64))
+            # Renumber the surviving vectors to their new dense chunk ids
+            mapping = np.full(len(self.chunks), -1, dtype=np.int64)
+            mapping[keep] = np.arange(len(keep), dtype=np.int64)
+            ids = faiss.vector_to_array(self.faiss_index.id_map)
+            faiss.copy_array_to_vector(mapping[ids], self.faiss_index.id_map)
+            self.faiss_index.construct_rev_map()
+        if vectors is not None:
+            self.faiss_index.add_with_ids(
+                vectors, np.arange(len(keep), len(keep) + len(texts), dtype=np.int64)
+            )
+
+    def _update_bm25(self, keep: List[int], texts: List[str]):
+        vocabulary = dict(self.bm25.vocabulary)
+        kept = sparse.csr_matrix(self.counts)[:, keep]
+        added = term_counts([tokenize(text) for text in texts], vocabulary)
+        kept.resize((len(vocabulary), kept.shape[1]))
+        counts = sparse.hstack([kept, added], format="csr")
+
+        # Forget terms that no remaining chunk uses, so the statistics match
+        # a fresh build over the same chunks
+        used = np.flatnonzero(counts.getnnz(axis=1))
+        if len(used) < len(vocabulary):
+            terms = np.empty(len(vocabulary), dtype=object)
+            for term, row in vocabulary.items():
+                terms[row] = term
+            counts = counts[used]
+            vocabulary = {term: row for row, term in enumerate(terms[used])}
+
+        self.counts = counts
+        self.bm25 = SparseBM25.from_counts(vocabulary, counts)
@@ -0,0 +1,63 @@
+from typing import List, Optional, Sequence, Tuple, Dict
+
+ScoredIds = List[Tuple[int, float]]
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[ScoredIds],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> ScoredIds:
+    """Fuse rankings by summing ``weight / (k + rank)`` for each document.
+
+    Only ranks are used, so retrievers with incomparable score scales (BM25
+    scores, L2 distances) can be combined without calibration.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def min_max_normalize(scored: ScoredIds) -> ScoredIds:
+    if not scored:
+        return []
+    scores = [score for _, score in scored]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [(doc_id, 1.0) for doc_id, _ in scored]
+    return [(doc_id, (score - low) / (high - low)) for doc_id, score in scored]
+
+
+def weighted_score_fusion(
+    rankings: Sequence[ScoredIds],
+    weights: Optional[Sequence[float]] = None,
+) -> ScoredIds:
+    """Fuse rankings by a weighted sum of min-max normalized scores.
+
+    Scores must be "higher is better"; a document missing from a ranking
+    contributes zero for that retriever.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for doc_id, score in min_max_normalize(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * score
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse(
+    rankings: Sequence[ScoredIds],
+    method: str = "rrf",
+    weights: Optional[Sequence[float]] = None,
+) -> ScoredIds:
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, weights=weights)
+    elif method == "weighted":
+        return weighted_score_fusion(rankings, weights=weights)
+    else:
+        raise ValueError(f"Unknown fusion method: {method}")
@@ -0,0 +1,250 @@
+import os
+import json
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, asdict
+
+import numpy as np
+import faiss
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
+from src.application.ann import (
+    TRAIN_SAMPLE_SIZE,
+    mmap_io_flags,
+    new_faiss_index,
+    set_search_params,
+)
+from src.application.bm25 import SparseBM25, tokenize
+from src.entity.chunk import TextChunk
+
+
+INDEX_VERSION = 3
+
+CHUNKS_FILE = "chunks.json"
+CHUNK_INFO_FILE = "chunk_info.json"
+FAISS_FILE = "faiss.index"
+BM25_DIR = "bm25"
+METADATA_FILE = "metadata.json"
+
+
+@dataclass
+class IndexMetadata:
+    version: int
+    embedding_model: str
+    content_hash: str
+    num_chunks: int
+    source_path: str
+    # FAISS factory string the vectors are indexed with
+    index_factory: str = "Flat"
+
+
+def compute_content_hash(path: str, chunker_id: str) -> str:
+    """Hash of the source bytes plus the chunking configuration."""
+    digest = hashlib.sha256()
+    digest.update(chunker_id.encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RetrievalIndex:
+    """Chunks, FAISS index and BM25 statistics for a single textbook.
+
+    Built once into ``index_dir`` and reloaded (with the FAISS index
+    memory-mapped) on later startups as long as the textbook contents and
+    the embedding model are unchanged.
+    """
+
+    def __init__(
+        self,
+        chunks: List[str],
+        faiss_index,
+        bm25: SparseBM25,
+        metadata: IndexMetadata,
+        chunk_info: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.chunks = chunks
+        self.faiss_index = faiss_index
+        self.bm25 = bm25
+        self.metadata = metadata
+        # Per-chunk structure (headings, kind, label, start_line)
+        self.chunk_info = chunk_info or [{} for _ in chunks]
+
+    @property
+    def content_hash(self) -> str:
+        return self.metadata.content_hash
+
+    @classmethod
+    def build(
+        cls,
+        chunks: List[TextChunk],
+        embeddings,
+        embedding_model: str,
+        content_hash: str,
+        source_path: str = "",
+        search_texts: Optional[List[str]] = None,
+        index_factory: str = "Flat",
+        train_size: int = TRAIN_SAMPLE_SIZE,
+    ) -> "RetrievalIndex":
+        """Embed and index ``chunks``.
+
+        ``search_texts`` replaces the chunk texts for embedding and BM25 (the
+        chunks are still what retrieval returns). ``index_factory`` is a FAISS
+        factory string; e.g. "SQ8" stores one byte per dimension, and
+        "IVF1024,PQ32" or "HNSW32" search approximately. Indexes that need
+        training are trained on ``train_size`` sampled vectors.
+        """
+        chunk_info = [
+            {k: v for k, v in asdict(chunk).items() if k != "text"} for chunk in chunks
+        ]
+        chunks = [chunk.text for chunk in chunks]
+        search_texts = search_texts if search_texts is not None else chunks
+        vectors = np.asarray(embeddings.embed_documents(search_texts), dtype=np.float32)
+        faiss_index = new_faiss_index(vectors, index_factory, train_size)
+        faiss_index.add(vectors)
+
+        bm25 = SparseBM25.build([tokenize(text) for text in search_texts])
+
+        metadata = IndexMetadata(
+            version=INDEX_VERSION,
+            embedding_model=embedding_model,
+            content_hash=content_hash,
+            num_chunks=len(chunks),
+            source_path=source_path,
+            index_factory=index_factory,
+        )
+        return cls(chunks, faiss_index, bm25, metadata, chunk_info)
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        # Drop the old metadata first, so an interrupted save of an existing
+        # index is rebuilt instead of being loaded half-updated.
+        metadata_path = os.path.join(index_dir, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+
+        self._save_files(index_dir)
+
+        # Metadata is written last so a partially written directory is never
+        # mistaken for a valid index.
+        with open(metadata_path, "w") as f:
+            json.dump(asdict(self.metadata), f, indent=2)
+
+    def _save_files(self, index_dir: str):
+        with open(os.path.join(index_dir, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        with open(os.path.join(index_dir, CHUNK_INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.chunk_info, f, ensure_ascii=False)
+
+        faiss.write_index(self.faiss_index, os.path.join(index_dir, FAISS_FILE))
+
+        self.bm25.save(os.path.join(index_dir, BM25_DIR))
+
+    @staticmethod
+    def read_metadata(index_dir: str) -> Optional[IndexMetadata]:
+        path = os.path.join(index_dir, METADATA_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                return IndexMetadata(**json.load(f))
+        except (ValueError, TypeError):
+            return None
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "RetrievalIndex":
+        metadata = cls.read_metadata(index_dir)
+        if metadata is None:
+            raise FileNotFoundError(f"No retrieval index found at {index_dir}")
+
+        with open(os.path.join(index_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        with open(os.path.join(index_dir, CHUNK_INFO_FILE), "r", encoding="utf-8") as f:
+            chunk_info = json.load(f)
+
+        io_flags = mmap_io_flags(metadata.index_factory) if mmap else 0
+        faiss_index = faiss.read_index(os.path.join(index_dir, FAISS_FILE), io_flags)
+
+        bm25 = SparseBM25.load(os.path.join(index_dir, BM25_DIR), mmap=mmap)
+
+        return cls(chunks, faiss_index, bm25, metadata, chunk_info)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        index_dir: str,
+        source_path: str,
+        chunker: Callable[[str], List[TextChunk]],
+        chunker_id: str,
+        get_embeddings: Callable[[], Any],
+        embedding_model: str,
+        index_factory: str = "Flat",
+    ) -> "RetrievalIndex":
+        """Load the index from ``index_dir``, rebuilding it if it is stale.
+
+        ``get_embeddings`` is only called when the index has to be built, so
+        loading an up-to-date index does not wait for the embedding model.
+        Changing ``index_factory`` also rebuilds it.
+        """
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"Textbook not found at {source_path}")
+
+        content_hash = compute_content_hash(source_path, chunker_id)
+        metadata = cls.read_metadata(index_dir)
+        if (
+            metadata is not None
+            and metadata.version == INDEX_VERSION
+            and metadata.content_hash == content_hash
+            and metadata.embedding_model == embedding_model
+            and metadata.index_factory == index_factory
+        ):
+            print(f"Loading retrieval index from {index_dir}")
+            return cls.load(index_dir)
+
+        print(f"Building retrieval index in {index_dir}")
+        with open(source_path, "r", encoding="utf-8") as f:
+            chunks = chunker(f.read())
+
+        index = cls.build(
+            chunks,
+            get_embeddings(),
+            embedding_model,
+            content_hash,
+            source_path,
+            index_factory=index_factory,
+        )
+        index.save(index_dir)
+        return index
+
+    def set_search_params(self, params: Optional[str]) -> List[str]:
+        """Set FAISS search parameters, e.g. "nprobe=16" or "efSearch=128"."""
+        return set_search_params(self.faiss_index, params)
+
+    def search(self, vector, top_k: int) -> List[Tuple[int, float]]:
+        """Nearest chunks to an embedding, as (chunk id, negated L2 distance)."""
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        distances, ids = self.faiss_index.search(query, top_k)
+        return [
+            (int(i), -float(distance))
+            for i, distance in zip(ids[0], distances[0])
+            if i >= 0
+        ]
+
+    def as_vectorstore(self, embeddings) -> FAISS:
+        ids = [str(i) for i in range(len(self.chunks))]
+        docstore = InMemoryDocstore(
+            {
+                doc_id: Document(page_content=chunk, metadata={"chunk_id": i, **info})
+                for i, (doc_id, chunk, info) in enumerate(
+                    zip(ids, self.chunks, self.chunk_info)
+                )
+            }
+        )
+        return FAISS(
+            embedding_function=embeddings,
+            index=self.faiss_index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids)),
+        )
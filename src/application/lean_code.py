@@ -0,0 +1,81 @@
+import re
+from typing import List
+
+FENCE_OPEN = re.compile(r"```[ \t]*(?:lean4|lean)?[ \t]*\n")
+FENCE_CLOSE = re.compile(r"\n[ \t]*```")
+# A bare declaration (no fence) is complete once its `sorry` line has ended
+SORRY_DECLARATION = re.compile(
+    r"^(?:theorem|lemma|example)\b[\s\S]*?:=\s*(?:by\s+)?sorry\b[^\n]*\n",
+    re.MULTILINE,
+)
+
+
+def lean_code_complete(text: str) -> bool:
+    """Whether generated text already contains a finished Lean code block.
+
+    With a code fence, the block is finished once the closing fence appears.
+    Without one, it is finished once a theorem/lemma stated with ``sorry``
+    has been fully written out.
+    """
+    opening = FENCE_OPEN.search(text)
+    if opening is not None:
+        return FENCE_CLOSE.search(text, opening.end() - 1) is not None
+    if "```" in text:
+        # Opening fence not finished yet (e.g. "```lea")
+        return False
+    return SORRY_DECLARATION.search(text) is not None
+
+
+def extract_lean_code(text: str) -> str:
+    """Return the first fenced Lean block's contents, or the trimmed text."""
+    opening = FENCE_OPEN.search(text)
+    if opening is None:
+        return text.strip()
+    closing = FENCE_CLOSE.search(text, opening.end() - 1)
+    end = closing.start() if closing is not None else len(text)
+    return text[opening.end() : end].strip()
+
+
+class GeneratedText:
+    """Decoded text of one generated sequence, extended a token at a time.
+
+    Re-decoding the whole sequence at every step makes a generation O(n²)
+    in its length. Only the tokens since the last decoded boundary are
+    decoded here, together with the token before it so that the
+    tokenizer's handling of leading spaces is kept; a token that ends in
+    the middle of a character is held back until the next one completes
+    it. Tracking stops at EOS or once the code block is complete, so the
+    padding that follows in a finished batch row costs nothing.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids: List[int] = []
+        self.text = ""
+        self.ended = False
+        self.complete = False
+        # ids[_prefix:_read] were decoded last time; ids[_read:] are pending
+        self._prefix = 0
+        self._read = 0
+
+    def extend(self, token_ids: List[int]):
+        if self.ended or self.complete:
+            return
+        for token_id in token_ids:
+            if token_id == self.tokenizer.eos_token_id:
+                self.ended = True
+                break
+            self.ids.append(token_id)
+        before = self.tokenizer.decode(
+            self.ids[self._prefix : self._read], skip_special_tokens=True
+        )
+        after = self.tokenizer.decode(self.ids[self._prefix :], skip_special_tokens=True)
+        if len(after) <= len(before) or after.endswith("�"):
+            return
+        new_text = after[len(before) :]
+        self.text += new_text
+        self._prefix, self._read = self._read, len(self.ids)
+        # Only a newline (fence opening, end of a `sorry` line) or a backtick
+        # (closing fence) can finish a code block
+        if "\n" in new_text or "`" in new_text:
+            self.complete = lean_code_complete(self.text)
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+class ComponentLoader:
+    """Loads named components at most once, lazily or ahead of time.
+
+    ``get`` returns a component, loading it in the calling thread if nobody
+    has started it yet and otherwise waiting for the load in progress.
+    ``preload`` starts loads on a thread pool so that independent components
+    (model weights, embedding model, retrieval index) load concurrently.
+    Loaders may ``get`` other components; the pool has one worker per
+    component, so a dependency is never stuck behind its dependents.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Any]]):
+        self._loaders = loaders
+        self._futures: Dict[str, Future] = {}
+        # name -> (seconds after creation when loading started, load seconds)
+        self._timings: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(loaders), thread_name_prefix="loader"
+        )
+        self._created = time.perf_counter()
+
+    def _claim(self, name: str) -> Tuple[Future, bool]:
+        if name not in self._loaders:
+            raise ValueError(f"Unknown component: {name}")
+        with self._lock:
+            future = self._futures.get(name)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._futures[name] = future
+            return future, True
+
+    def _run(self, name: str, future: Future):
+        future.set_running_or_notify_cancel()
+        start = time.perf_counter()
+        try:
+            value = self._loaders[name]()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._timings[name] = (start - self._created, elapsed)
+        print(f"Loaded {name} in {elapsed:.2f}s")
+        future.set_result(value)
+
+    def preload(self, names: Iterable[str]):
+        for name in names:
+            future, owner = self._claim(name)
+            if owner:
+                self._executor.submit(self._run, name, future)
+
+    def get(self, name: str) -> Any:
+        future, owner = self._claim(name)
+        if owner:
+            self._run(name, future)
+        return future.result()
+
+    def loaded(self, name: str) -> bool:
+        with self._lock:
+            future = self._futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {"started": started, "seconds": seconds}
+                for name, (started, seconds) in sorted(
+                    self._timings.items(), key=lambda item: item[1][0]
+                )
+            }
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from src.application.index import RetrievalIndex
+from src.entity.chunk import TextChunk
+from src.entity.declaration import MathlibDeclaration
+
+# Bump when extraction changes, so prebuilt indexes are recognized as stale
+EXTRACTOR_VERSION = 1
+
+DECLARATION = re.compile(
+    r"^(?P<modifiers>(?:@\[[^\]]*\]\s*)*"
+    r"(?:(?:private|protected|noncomputable|nonrec|partial|unsafe|scoped)\s+)*)"
+    r"(?P<kind>theorem|lemma|def|abbrev|instance|structure|class inductive|class|inductive)\s+"
+    r"(?P<name>[^\s:({\[⦃]+)(?P<rest>.*)$"
+)
+# A line holding only attributes, e.g. "@[simp, norm_cast]" above a declaration
+ATTRIBUTES_ONLY = re.compile(r"^(?:@\[[^\]]*\]\s*)+$")
+NAMESPACE = re.compile(r"^namespace\s+(\S+)")
+SECTION = re.compile(r"^(?:noncomputable\s+)?section\b\s*(\S*)")
+END = re.compile(r"^end\b\s*(\S*)\s*$")
+# Where the statement ends and the proof or definition body begins
+BODY = re.compile(r":=|\bwhere\b|^\s*\|")
+
+MAX_SIGNATURE_LINES = 20
+MAX_SIGNATURE_CHARS = 600
+MAX_DOCSTRING_CHARS = 300
+
+
+def mathlib_checkout(repl_dir: str = "repl") -> Tuple[str, str]:
+    """Path and pinned revision of the Mathlib package of the Lake project."""
+    with open(os.path.join(repl_dir, "lake-manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    package = next(
+        (p for p in manifest.get("packages", []) if p.get("name") == "mathlib"), None
+    )
+    if package is None:
+        raise ValueError(f"{repl_dir}/lake-manifest.json does not pin mathlib")
+    path = os.path.join(
+        repl_dir, manifest.get("packagesDir", ".lake/packages"), "mathlib"
+    )
+    if not os.path.isdir(os.path.join(path, "Mathlib")):
+        raise FileNotFoundError(
+            f"Mathlib checkout not found at {path}; run `lake exe cache get` in {repl_dir}"
+        )
+    return path, package["rev"]
+
+
+def _collapse(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _shorten(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def _signature(lines: List[str], start: int, rest: str) -> str:
+    parts = []
+    for offset, line in enumerate([rest] + lines[start + 1 : start + MAX_SIGNATURE_LINES]):
+        if offset > 0 and (not line.strip() or DECLARATION.match(line)):
+            break
+        body = BODY.search(line)
+        if body is not None:
+            parts.append(line[: body.start()])
+            break
+        parts.append(line)
+    return _shorten(_collapse(" ".join(parts)), MAX_SIGNATURE_CHARS)
+
+
+def extract_declarations(path: str, module: str) -> List[MathlibDeclaration]:
+    """Named declarations of one Lean source file, with docstrings.
+
+    A line-based scan, not elaboration: it follows ``namespace``/``section``
+    blocks to qualify names, attaches the ``/-- ... -/`` docstring written
+    just before a declaration and keeps its binders and type up to ``:=``,
+    ``where`` or a pattern-matching ``|``. Private declarations and
+    anonymous instances are skipped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    declarations = []
+    scopes: List[Tuple[str, str]] = []
+    docstring: Optional[List[str]] = None
+    pending_doc: Optional[str] = None
+    in_comment = False
+
+    for number, line in enumerate(lines):
+        stripped = line.strip()
+        if docstring is not None:
+            docstring.append(line)
+            if "-/" in line:
+                text = _collapse(" ".join(docstring))
+                pending_doc = _shorten(text[3 : text.rindex("-/")].strip(), MAX_DOCSTRING_CHARS)
+                docstring = None
+            continue
+        if in_comment:
+            in_comment = "-/" not in line
+            continue
+        if stripped.startswith("/--"):
+            docstring = [stripped]
+            if "-/" in stripped[3:]:
+                text = _collapse(stripped)
+                pending_doc = _shorten(text[3 : text.rindex("-/")].strip(), MAX_DOCSTRING_CHARS)
+                docstring = None
+            continue
+        if stripped.startswith("/-"):
+            in_comment = "-/" not in stripped[2:]
+            continue
+        if not stripped or stripped.startswith("--") or ATTRIBUTES_ONLY.match(stripped):
+            continue
+
+        match = NAMESPACE.match(line)
+        if match is not None:
+            scopes.append(("namespace", match.group(1)))
+            pending_doc = None
+            continue
+        match = SECTION.match(line)
+        if match is not None:
+            scopes.append(("section", match.group(1)))
+            pending_doc = None
+            continue
+        match = END.match(line)
+        if match is not None:
+            name = match.group(1)
+            # Pop up to the scope this `end` closes (just one if unnamed)
+            while scopes:
+                if scopes.pop()[1] == name or not name:
+                    break
+            pending_doc = None
+            continue
+
+        match = DECLARATION.match(line)
+        doc, pending_doc = pending_doc, None
+        if match is None or "private" in match.group("modifiers").split():
+            continue
+        name = match.group("name")
+        if name.startswith("_root_."):
+            name = name[len("_root_.") :]
+        else:
+            namespace = ".".join(n for kind, n in scopes if kind == "namespace")
+            name = f"{namespace}.{name}" if namespace else name
+        declarations.append(
+            MathlibDeclaration(
+                name=name,
+                kind=match.group("kind"),
+                signature=_signature(lines, number, match.group("rest")),
+                module=module,
+                docstring=doc,
+                line=number + 1,
+            )
+        )
+    return declarations
+
+
+def _extract_file(args: Tuple[str, str]) -> List[MathlibDeclaration]:
+    return extract_declarations(*args)
+
+
+def extract_mathlib(mathlib_dir: str, workers: Optional[int] = None) -> List[MathlibDeclaration]:
+    """Declarations of every ``Mathlib/**/*.lean`` file, scanned in parallel."""
+    files = []
+    for root, dirs, names in os.walk(os.path.join(mathlib_dir, "Mathlib")):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith(".lean"):
+                path = os.path.join(root, name)
+                module = os.path.relpath(path, mathlib_dir)[: -len(".lean")]
+                files.append((path, module.replace(os.sep, ".")))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_extract_file, files, chunksize=32)
+        return [declaration for result in results for declaration in result]
+
+
+def name_words(name: str) -> str:
+    """``Nat.succ_le_iff`` -> ``Nat succ le iff``; camelCase is split too."""
+    words = re.split(r"[._']+", name)
+    return " ".join(re.sub(r"(?<=[a-z])(?=[A-Z])", " ", w) for w in words if w)
+
+
+def search_text(declaration: MathlibDeclaration) -> str:
+    """What BM25 and the embedding model see for a declaration."""
+    return " ".join(
+        part
+        for part in (
+            name_words(declaration.name),
+            declaration.docstring,
+            declaration.signature,
+        )
+        if part
+    )
+
+
+def content_hash(rev: str, index_factory: str) -> str:
+    return f"mathlib:{rev}:{EXTRACTOR_VERSION}:{index_factory}"
+
+
+def default_index_dir(repl_dir: str = "repl") -> str:
+    with open(os.path.join(repl_dir, "lake-manifest.json"), "r", encoding="utf-8") as f:
+        packages = json.load(f).get("packages", [])
+    rev = next((p["rev"] for p in packages if p.get("name") == "mathlib"), "unknown")
+    return os.path.join(".rag_index", f"mathlib-{rev[:12]}")
+
+
+def build_mathlib_index(
+    repl_dir: str,
+    index_dir: str,
+    embeddings,
+    embedding_model: str,
+    index_factory: str = "SQ8",
+    workers: Optional[int] = None,
+) -> RetrievalIndex:
+    """Extract the pinned Mathlib's declarations and save a retrieval index."""
+    mathlib_dir, rev = mathlib_checkout(repl_dir)
+    print(f"Extracting declarations from {mathlib_dir} ({rev[:12]})")
+    declarations = extract_mathlib(mathlib_dir, workers)
+    print(f"Embedding {len(declarations)} declarations")
+    index = RetrievalIndex.build(
+        [
+            TextChunk(
+                text=d.text,
+                headings=[d.module],
+                kind=d.kind,
+                label=d.name,
+                start_line=d.line,
+            )
+            for d in declarations
+        ],
+        embeddings,
+        embedding_model,
+        content_hash(rev, index_factory),
+        source_path=mathlib_dir,
+        search_texts=[search_text(d) for d in declarations],
+        index_factory=index_factory,
+    )
+    index.save(index_dir)
+    return index
+
+
+def load_mathlib_index(
+    index_dir: str, embedding_model: str, repl_dir: Optional[str] = "repl"
+) -> RetrievalIndex:
+    """Memory-map a prebuilt Mathlib index; nothing is re-embedded.
+
+    The vector codes of Flat, SQ (the default), PQ and HNSW indexes and the
+    inverted lists of IVF indexes stay on disk until searches touch them;
+    see ``mmap_io_flags``.
+    """
+    metadata = RetrievalIndex.read_metadata(index_dir)
+    if metadata is None:
+        raise FileNotFoundError(
+            f"No Mathlib index at {index_dir}; build it with build_mathlib_index.py"
+        )
+    if metadata.embedding_model != embedding_model:
+        raise ValueError(
+            f"Mathlib index at {index_dir} was embedded with {metadata.embedding_model}, "
+            f"not {embedding_model}"
+        )
+    if repl_dir is not None:
+        try:
+            _, rev = mathlib_checkout(repl_dir)
+        except (FileNotFoundError, ValueError):
+            rev = None
+        if rev is not None and f":{rev}:" not in metadata.content_hash:
+            print(f"Warning: Mathlib index at {index_dir} does not match the pinned revision {rev[:12]}")
+    return RetrievalIndex.load(index_dir)
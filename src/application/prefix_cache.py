@@ -0,0 +1,121 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import DynamicCache
+
+
+def cache_nbytes(cache: DynamicCache) -> int:
+    return sum(
+        t.numel() * t.element_size() for layer in cache.to_legacy_cache() for t in layer
+    )
+
+
+class PrefixKVCache:
+    """LRU cache of past key/values for shared prompt prefixes.
+
+    Prompts are prefilled segment by segment at the boundaries recorded by
+    the prompt builder (end of the instruction header, end of each context
+    chunk). Each boundary's key/values are stored, so a later prompt that
+    starts with the same header, or with the same leading chunks, only runs
+    the model over the part that differs. Entries are evicted least recently
+    used first once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self._entries: "OrderedDict[bytes, Tuple[DynamicCache, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(input_ids: List[int]) -> bytes:
+        return hashlib.sha1(np.asarray(input_ids, dtype=np.int64).tobytes()).digest()
+
+    def get(self, input_ids: List[int]) -> Optional[DynamicCache]:
+        with self._lock:
+            entry = self._entries.get(self._key(input_ids))
+            if entry is None:
+                return None
+            self._entries.move_to_end(self._key(input_ids))
+        # generate() extends the cache in place, so hand out a copy
+        return copy.deepcopy(entry[0])
+
+    def put(self, input_ids: List[int], cache: DynamicCache):
+        size = cache_nbytes(cache)
+        if size > self.max_bytes:
+            return
+        key = self._key(input_ids)
+        stored = copy.deepcopy(cache)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (stored, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused_tokens": self.reused_tokens,
+        }
+
+    @torch.no_grad()
+    def prefill(
+        self, model, input_ids: List[int], prefix_lengths: List[int]
+    ) -> Tuple[Optional[DynamicCache], int]:
+        """Return key/values for the longest boundary prefix of ``input_ids``.
+
+        At least one token is always left uncached so the caller still gets
+        logits for the last prompt position. Returns ``(None, 0)`` when the
+        prompt has no usable boundaries.
+        """
+        boundaries = sorted(n for n in set(prefix_lengths) if 0 < n < len(input_ids))
+        if not boundaries:
+            return None, 0
+
+        cache, start = None, 0
+        for n in reversed(boundaries):
+            cached = self.get(input_ids[:n])
+            if cached is not None:
+                cache, start = cached, n
+                break
+        with self._lock:
+            if cache is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.reused_tokens += start
+
+        device = next(model.parameters()).device
+        for n in boundaries:
+            if n <= start:
+                continue
+            if cache is None:
+                cache = DynamicCache()
+            model(
+                input_ids=torch.tensor([input_ids[start:n]], device=device),
+                past_key_values=cache,
+                use_cache=True,
+            )
+            self.put(input_ids[:n], cache)
+            start = n
+
+        return cache, start
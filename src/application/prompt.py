@@ -0,0 +1,185 @@
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from src.application.cache import LRUCache
+
+CONTEXT_TEMPLATE = """Given the following mathematical context:
+
+{context}
+
+{facts}Please formalize the following statement in Lean 4:
+
+{query}
+
+Provide only the Lean 4 code without any explanations:"""
+
+NO_CONTEXT_TEMPLATE = """{facts}Please formalize the following mathematical statement in Lean 4:
+
+{query}
+
+Provide only the Lean 4 code without any explanations:"""
+
+# Mathlib declarations, placed after the textbook context (or first, when
+# there is none)
+FACTS_SECTION = """Here are some relevant facts from the Lean math library:
+
+{facts}
+
+"""
+
+CHUNK_SEPARATOR = "\n\n"
+
+# Token counts of separately tokenized pieces can differ slightly from the
+# count of the joined string, so keep a little headroom.
+BOUNDARY_SLACK_TOKENS = 2
+
+
+@dataclass
+class PackedPrompt:
+    prompt: str
+    input_ids: List[int]
+    context_chunks: List[str]
+    # Tokens of packed context chunks and facts
+    context_tokens: int
+    # Context chunks and facts left out to stay within the budget
+    dropped_chunks: int
+    # Token offsets where reusable prefixes end (instruction header, then
+    # each packed chunk); only filled when the builder tracks prefixes.
+    prefix_lengths: List[int] = field(default_factory=list)
+    facts: List[str] = field(default_factory=list)
+
+
+class PromptBuilder:
+    """Packs ranked context chunks into a prompt under a token budget.
+
+    Chunk token counts are computed once and cached. Chunks are taken in
+    rank order and skipped when they would overflow the budget, so the
+    instructions and the statement to formalize are never truncated.
+    Mathlib facts share the budget and are packed before the context, as
+    they are short and name lemmas the model can use directly.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        max_prompt_tokens: int = 2048,
+        context_token_budget: Optional[int] = None,
+        cache_size: int = 4096,
+        track_prefixes: bool = False,
+    ):
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_token_budget = context_token_budget
+        self.track_prefixes = track_prefixes
+        self._token_counts = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._separator_tokens = self.count_tokens(CHUNK_SEPARATOR)
+
+    def count_tokens(self, text: str) -> int:
+        with self._lock:
+            count = self._token_counts.get(text)
+        if count is None:
+            count = len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+            with self._lock:
+                self._token_counts.put(text, count)
+        return count
+
+    def _encode(self, prompt: str) -> List[int]:
+        return self.tokenizer(prompt)["input_ids"]
+
+    def _prefix_lengths(
+        self, prompt: str, input_ids: List[int], char_offsets: List[int]
+    ) -> List[int]:
+        if not self.track_prefixes:
+            return []
+        lengths = []
+        for offset in char_offsets:
+            ids = self._encode(prompt[:offset])
+            # A boundary is only reusable if tokenizing the prefix on its own
+            # gives exactly the tokens the full prompt starts with.
+            if input_ids[: len(ids)] == ids:
+                lengths.append(len(ids))
+        return lengths
+
+    def _pack(self, items: List[str], budget: int, used: int = 0):
+        packed = []
+        for item in items:
+            cost = self.count_tokens(item) + (self._separator_tokens if packed else 0)
+            if used + cost <= budget:
+                packed.append(item)
+                used += cost
+        return packed, used
+
+    def _without_context(
+        self,
+        query: str,
+        dropped_chunks: int = 0,
+        facts: Optional[List[str]] = None,
+        fact_tokens: int = 0,
+    ) -> PackedPrompt:
+        section = FACTS_SECTION.format(facts=CHUNK_SEPARATOR.join(facts)) if facts else ""
+        prompt = NO_CONTEXT_TEMPLATE.format(facts=section, query=query)
+        input_ids = self._encode(prompt)
+        header_end = NO_CONTEXT_TEMPLATE.index("{query}") - len("{facts}") + len(section)
+        return PackedPrompt(
+            prompt,
+            input_ids,
+            [],
+            fact_tokens,
+            dropped_chunks,
+            self._prefix_lengths(prompt, input_ids, [header_end]),
+            list(facts or []),
+        )
+
+    def build(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        facts: Optional[List[str]] = None,
+    ) -> PackedPrompt:
+        context, facts = context or [], facts or []
+        if not context and not facts:
+            return self._without_context(query)
+
+        template = CONTEXT_TEMPLATE if context else NO_CONTEXT_TEMPLATE
+        section = FACTS_SECTION.format(facts="") if facts else ""
+        overhead = len(
+            self._encode(template.format(context="", facts=section, query=query))
+        )
+        budget = self.max_prompt_tokens - overhead - BOUNDARY_SLACK_TOKENS
+        if self.context_token_budget is not None:
+            budget = min(budget, self.context_token_budget)
+
+        packed_facts, used = self._pack(facts, budget)
+        packed, used = self._pack(context, budget, used)
+        dropped = len(context) + len(facts) - len(packed) - len(packed_facts)
+        if not packed:
+            return self._without_context(query, dropped, packed_facts, used)
+
+        prompt = CONTEXT_TEMPLATE.format(
+            context=CHUNK_SEPARATOR.join(packed),
+            facts=(
+                FACTS_SECTION.format(facts=CHUNK_SEPARATOR.join(packed_facts))
+                if packed_facts
+                else ""
+            ),
+            query=query,
+        )
+        input_ids = self._encode(prompt)
+
+        header_end = CONTEXT_TEMPLATE.index("{context}")
+        offsets = [header_end]
+        for i, chunk in enumerate(packed):
+            separator = len(CHUNK_SEPARATOR) if i > 0 else 0
+            offsets.append(offsets[-1] + separator + len(chunk))
+
+        return PackedPrompt(
+            prompt,
+            input_ids,
+            packed,
+            used,
+            dropped,
+            self._prefix_lengths(prompt, input_ids, offsets),
+            packed_facts,
+        )
@@ -0,0 +1,175 @@
+import os
+import re
+import time
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+import transformers
+from torch import nn
+from transformers import AutoModelForCausalLM
+
+PRECISIONS = ("fp16", "bf16", "fp32", "int8", "int4")
+QUANTIZED_PRECISIONS = ("int8", "int4")
+
+FLOAT_DTYPES = {
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "fp32": torch.float32,
+    # Dynamic int8 quantization replaces float32 Linear layers; the rest of
+    # the model stays in float32.
+    "int8": torch.float32,
+    # 4-bit weights are dequantized to bfloat16 for each matmul.
+    "int4": torch.bfloat16,
+}
+
+INT4_GROUP_SIZE = 128
+
+
+def default_precision(device: str) -> str:
+    # float16 matmuls are slow on most CPUs; bfloat16 keeps the same memory
+    return "fp16" if device == "cuda" else "bf16"
+
+
+class Int4Linear(nn.Module):
+    """Linear layer with 4-bit weights and per-group bfloat16 scales.
+
+    Weights are stored two per byte with symmetric per-group quantization
+    (``group_size`` input features per scale) and dequantized on every
+    forward pass. This cuts weight memory to roughly a quarter of bfloat16,
+    at the cost of the extra dequantization work.
+    """
+
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+        bias: bool = True,
+        group_size: int = INT4_GROUP_SIZE,
+        dtype: torch.dtype = torch.bfloat16,
+    ):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer(
+            "packed", torch.zeros(out_features, in_features // 2, dtype=torch.uint8)
+        )
+        self.register_buffer(
+            "scales", torch.zeros(out_features, in_features // group_size, dtype=dtype)
+        )
+        self.bias = nn.Parameter(torch.zeros(out_features, dtype=dtype)) if bias else None
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, group_size: int = INT4_GROUP_SIZE) -> "Int4Linear":
+        out_features, in_features = linear.weight.shape
+        dtype = FLOAT_DTYPES["int4"]
+        module = cls(in_features, out_features, linear.bias is not None, group_size, dtype)
+
+        groups = linear.weight.detach().float().view(out_features, -1, group_size)
+        scales = (groups.abs().amax(dim=-1, keepdim=True) / 7).clamp(min=1e-8)
+        q = (groups / scales).round().clamp(-8, 7).add(8).to(torch.uint8)
+        q = q.view(out_features, in_features)
+
+        module.packed.copy_(q[:, 0::2] | (q[:, 1::2] << 4))
+        module.scales.copy_(scales.squeeze(-1))
+        if linear.bias is not None:
+            module.bias.data.copy_(linear.bias.detach())
+        return module
+
+    def dequantize(self) -> torch.Tensor:
+        q = torch.stack([self.packed & 0xF, self.packed >> 4], dim=-1)
+        q = q.view(self.out_features, -1, self.group_size).to(self.scales.dtype) - 8
+        weight = q * self.scales.unsqueeze(-1)
+        return weight.view(self.out_features, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        return F.linear(x, self.dequantize().to(x.dtype), bias)
+
+
+def quantize_int4(model: nn.Module, group_size: int = INT4_GROUP_SIZE) -> nn.Module:
+    """Replace Linear layers with Int4Linear in place.
+
+    The output projection is kept in full precision, since it is small
+    relative to the transformer blocks and most sensitive to rounding.
+    Layers whose input size is not a multiple of ``group_size`` are skipped.
+    """
+    output_embeddings = model.get_output_embeddings()
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if (
+                isinstance(child, nn.Linear)
+                and child is not output_embeddings
+                and child.in_features % group_size == 0
+            ):
+                setattr(parent, name, Int4Linear.from_linear(child, group_size))
+    return model
+
+
+def quantize_int8(model: nn.Module) -> nn.Module:
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_cache_path(cache_dir: str, model_name: str, precision: str) -> str:
+    # Pickled modules are only loadable by the library versions that wrote them
+    versions = f"torch{torch.__version__}-transformers{transformers.__version__}"
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+    return os.path.join(cache_dir, f"{name}-{precision}-{versions}.pt")
+
+
+def load_quantized(
+    model_name: str, precision: str, cache_dir: str = ".model_cache"
+) -> nn.Module:
+    """Load a CPU-quantized model, converting and caching it on first use.
+
+    Conversion needs the full-precision weights in memory once; later loads
+    memory-map the cached module from ``cache_dir`` instead.
+    """
+    path = quantized_cache_path(cache_dir, model_name, precision)
+    if os.path.exists(path):
+        print(f"Loading {precision} weights from {path}")
+        return torch.load(path, weights_only=False, mmap=True)
+
+    print(f"Converting {model_name} to {precision} (one-time step)...")
+    start = time.perf_counter()
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=FLOAT_DTYPES[precision],
+        trust_remote_code=True,
+        low_cpu_mem_usage=True,
+    ).eval()
+    model = quantize_int8(model) if precision == "int8" else quantize_int4(model)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(model, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Saved {precision} weights to {path} in {time.perf_counter() - start:.1f}s")
+    return model
+
+
+def load_model(
+    model_name: str,
+    precision: Optional[str] = None,
+    device: str = "cpu",
+    cache_dir: str = ".model_cache",
+) -> nn.Module:
+    precision = precision or default_precision(device)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+
+    if precision in QUANTIZED_PRECISIONS:
+        if device != "cpu":
+            raise ValueError(f"{precision} quantization is only supported on CPU")
+        return load_quantized(model_name, precision, cache_dir).eval()
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=FLOAT_DTYPES[precision],
+        device_map="auto" if device == "cuda" else None,
+        trust_remote_code=True,
+    )
+    if device != "cuda":
+        model = model.to(device)
+    return model
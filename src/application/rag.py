@@ -1,30 +1,70 @@
 import os
 import json
+import time
 import numpy as np
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteriaList
 import torch
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
 from langchain.embeddings import HuggingFaceEmbeddings
+from src.application.cache import RetrievalCache
+from src.application.candidates import CandidateChecker
+from src.application.chunking import StructuredChunker
+from src.application.corpus import CorpusIndex
+from src.application.bm25 import tokenize
+from src.application.fusion import FUSION_METHODS, ScoredIds, fuse
+from src.application.index import RetrievalIndex
+from src.application.loading import ComponentLoader
+from src.application.mathlib import load_mathlib_index
+from src.application.prefix_cache import PrefixKVCache
+from src.application.prompt import PackedPrompt, PromptBuilder
+from src.application.quantization import PRECISIONS, load_model
+from src.application.rerank import CrossEncoderReranker
+from src.application.scheduler import GenerationScheduler
+from src.application.speculative import SpeculativeDecoder
+from src.application.stopping import (
+    CancelStoppingCriteria,
+    LeanCodeStoppingCriteria,
+    extract_lean_code,
+)
+from src.application.verification import LeanVerifier
+from src.application.streaming import QueueStreamer, TokenQueue, decode_incrementally
+from src.entity.chunk import TextChunk
+from src.entity.metrics import RAGMetrics
+from src.entity.verification import VerificationResult
 
-try:
-    from rank_bm25 import BM25Okapi
+# "structured" follows the textbook's headings and theorem/proof labels;
+# "recursive" is the earlier fixed-size splitter with overlap.
+CHUNKERS = ("structured", "recursive")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
 
-    BM25_AVAILABLE = True
-except ImportError:
-    print("Warning: rank-bm25 not available. BM25 retrieval will be disabled.")
-    BM25_AVAILABLE = False
+RETRIEVAL_METHODS = ("bm25", "dense", "hybrid")
+# "textbook" is the chunked textbook or corpus; "mathlib" the optional index
+# of Mathlib declarations built by build_mathlib_index.py.
+RETRIEVAL_SOURCES = ("textbook", "mathlib")
 
+# Each retriever contributes this many times top_k candidates to hybrid fusion
+HYBRID_OVERFETCH = 4
 
-@dataclass
-class RAGMetrics:
-    mrr: float
-    top_k_recall: Dict[int, float]
-    retrieved_contexts: List[str]
-    query: str
-    ground_truth: Optional[str] = None
+# Best-of-N sampling needs diverse candidates; at the single-candidate
+# temperature (0.1) they would be near-identical.
+CANDIDATE_TEMPERATURE = 0.8
+
+# Lazily loaded pipeline components; generation without RAG does not need
+# the retrieval group.
+GENERATION_COMPONENTS = ("tokenizer", "prompt_builder", "model", "speculative")
+RETRIEVAL_COMPONENTS = (
+    "embeddings",
+    "index",
+    "vectorstore",
+    "mathlib_index",
+    "retrieval_cache",
+)
+VERIFICATION_COMPONENTS = ("verifier",)
+COMPONENTS = GENERATION_COMPONENTS + RETRIEVAL_COMPONENTS + VERIFICATION_COMPONENTS
 
 
 class MathematicalRAGPipeline:
@@ -33,160 +73,958 @@ class MathematicalRAGPipeline:
         model_name: str = "deepseek-ai/DeepSeek-Prover-V2-7B",
         embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
         textbook_path: str = "dataset/converted.txt",
+        index_dir: Optional[str] = None,
+        chunker: str = "structured",
+        index_factory: str = "Flat",
+        index_search_params: Optional[str] = None,
+        mathlib_index: Optional[str] = None,
+        mathlib_top_k: int = 5,
+        persist_retrieval_cache: bool = False,
+        fusion: str = "rrf",
+        fusion_weights: Optional[Tuple[float, float]] = None,
+        reranker: Optional[str] = None,
+        rerank_candidates: int = 50,
+        rerank_budget_ms: Optional[float] = 200.0,
+        max_prompt_tokens: int = 2048,
+        context_token_budget: Optional[int] = None,
+        prefix_cache_mb: int = 0,
+        stop_at_code_end: bool = True,
+        draft_model: Optional[str] = None,
+        prompt_lookup_tokens: int = 0,
+        precision: Optional[str] = None,
+        quantized_dir: str = ".model_cache",
+        preload: Iterable[str] = COMPONENTS,
+        lean_workers: int = 0,
+        lean_timeout: float = 60.0,
+        repl_dir: str = "repl",
+        num_candidates: int = 1,
+        persist_verification_cache: bool = False,
     ):
         self.model_name = model_name
         self.embedding_model = embedding_model
         self.textbook_path = textbook_path
+        self.index_dir = index_dir or os.path.join(
+            ".rag_index",
+            os.path.splitext(os.path.basename(os.path.normpath(textbook_path)))[0],
+        )
+        if chunker not in CHUNKERS:
+            raise ValueError(f"Unknown chunker: {chunker}")
+        self.chunker = chunker
+        self.index_factory = index_factory
+        self.index_search_params = index_search_params
+        self.mathlib_index_dir = mathlib_index
+        self.mathlib_top_k = mathlib_top_k
+        self.persist_retrieval_cache = persist_retrieval_cache
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        self.fusion = fusion
+        self.fusion_weights = fusion_weights
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="retrieval"
+        )
+        self.rerank_candidates = rerank_candidates
+        self.reranker = (
+            CrossEncoderReranker(reranker, budget_ms=rerank_budget_ms)
+            if reranker
+            else None
+        )
 
-        self._load_models()
-        self._load_textbook()
-        self._initialize_retrieval_methods()
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_token_budget = context_token_budget
+        self.prefix_cache = (
+            PrefixKVCache(prefix_cache_mb * 1024 * 1024) if prefix_cache_mb > 0 else None
+        )
 
-    def _load_models(self):
-        print(f"Loading model: {self.model_name}")
+        self.stop_at_code_end = stop_at_code_end
+        if draft_model and prompt_lookup_tokens > 0:
+            raise ValueError("Use either a draft model or prompt lookup, not both")
+        self.draft_model_name = draft_model
+        self.prompt_lookup_tokens = prompt_lookup_tokens
+        self.speculation_enabled = bool(draft_model) or prompt_lookup_tokens > 0
+        if precision is not None and precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        self.precision = precision
+        self.quantized_dir = quantized_dir
+        self.scheduler: Optional[GenerationScheduler] = None
+
+        self.lean_workers = lean_workers
+        self.lean_timeout = lean_timeout
+        self.repl_dir = repl_dir
+        self.persist_verification_cache = persist_verification_cache
+        if num_candidates < 1:
+            raise ValueError("num_candidates must be at least 1")
+        if num_candidates > 1 and lean_workers <= 0:
+            raise ValueError("Best-of-N sampling needs Lean verification (lean_workers > 0)")
+        if num_candidates > 1 and self.speculation_enabled:
+            raise ValueError("Speculative decoding generates one candidate at a time")
+        self.num_candidates = num_candidates
+
+        # Components load on first use; the preloaded ones start right away
+        # on a thread pool and load concurrently.
+        self._components = ComponentLoader(
+            {
+                "tokenizer": self._load_tokenizer,
+                "prompt_builder": self._load_prompt_builder,
+                "model": self._load_model,
+                "speculative": self._load_speculative,
+                "embeddings": self._load_embeddings,
+                "index": self._load_index,
+                "vectorstore": self._load_vectorstore,
+                "mathlib_index": self._load_mathlib_index,
+                "retrieval_cache": self._load_retrieval_cache,
+                "verifier": self._load_verifier,
+            }
+        )
+        self._components.preload(preload)
+
+    @property
+    def tokenizer(self):
+        return self._components.get("tokenizer")
+
+    @property
+    def prompt_builder(self) -> PromptBuilder:
+        return self._components.get("prompt_builder")
+
+    @property
+    def model(self):
+        return self._components.get("model")
+
+    @property
+    def speculative(self) -> Optional[SpeculativeDecoder]:
+        return self._components.get("speculative")
+
+    @property
+    def embeddings(self) -> HuggingFaceEmbeddings:
+        return self._components.get("embeddings")
+
+    @property
+    def index(self) -> RetrievalIndex:
+        return self._components.get("index")
+
+    @property
+    def text_chunks(self) -> List[str]:
+        return self.index.chunks
 
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        if self.tokenizer.pad_token is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+    @property
+    def chunk_info(self) -> List[dict]:
+        """Headings, kind, label and source line of each chunk."""
+        return self.index.chunk_info
+
+    @property
+    def bm25(self):
+        return self.index.bm25
+
+    @property
+    def vectorstore(self):
+        return self._components.get("vectorstore")
+
+    @property
+    def mathlib_index(self) -> Optional[RetrievalIndex]:
+        return self._components.get("mathlib_index")
+
+    @property
+    def retrieval_cache(self) -> RetrievalCache:
+        return self._components.get("retrieval_cache")
+
+    @property
+    def verifier(self) -> Optional[LeanVerifier]:
+        return self._components.get("verifier")
+
+    def startup_timings(self) -> Dict[str, Dict[str, float]]:
+        """When each loaded component started loading and how long it took."""
+        return self._components.timings()
+
+    def _load_tokenizer(self):
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Left padding keeps the last prompt token adjacent to generation in batches
+        tokenizer.padding_side = "left"
+        return tokenizer
+
+    def _load_prompt_builder(self) -> PromptBuilder:
+        return PromptBuilder(
+            self.tokenizer,
+            max_prompt_tokens=self.max_prompt_tokens,
+            context_token_budget=self.context_token_budget,
+            track_prefixes=self.prefix_cache is not None,
+        )
+
+    def _load_model(self):
+        print(f"Loading model: {self.model_name}")
 
         # Use GPU if available
         device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {device}")
 
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_name,
-            torch_dtype=torch.float16,
-            device_map="auto" if device == "cuda" else None,
-            trust_remote_code=True,
-        )
+        return load_model(self.model_name, self.precision, device, self.quantized_dir)
 
-        if device != "cuda":
-            self.model = self.model.to(device)
+    def _load_speculative(self) -> Optional[SpeculativeDecoder]:
+        if self.draft_model_name:
+            print(f"Loading draft model: {self.draft_model_name}")
+            draft_tokenizer = AutoTokenizer.from_pretrained(self.draft_model_name)
+            draft_model = AutoModelForCausalLM.from_pretrained(
+                self.draft_model_name,
+                torch_dtype=self.model.dtype,
+                trust_remote_code=True,
+            ).to(next(self.model.parameters()).device)
+            return SpeculativeDecoder(self.tokenizer, draft_model, draft_tokenizer)
+        if self.prompt_lookup_tokens > 0:
+            return SpeculativeDecoder(
+                self.tokenizer, prompt_lookup_tokens=self.prompt_lookup_tokens
+            )
+        return None
 
+    def _load_embeddings(self) -> HuggingFaceEmbeddings:
         print(f"Loading embedding model: {self.embedding_model}")
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model)
-        print("Models loaded successfully")
+        return HuggingFaceEmbeddings(model_name=self.embedding_model)
+
+    def _split_textbook(self, content: str) -> List[TextChunk]:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+        )
+        return [TextChunk(text) for text in text_splitter.split_text(content)]
 
-    def _load_textbook(self):
-        if not os.path.exists(self.textbook_path):
-            raise FileNotFoundError(f"Textbook not found at {self.textbook_path}")
+    def _load_index(self) -> RetrievalIndex:
+        if self.chunker == "structured":
+            structured = StructuredChunker()
+            chunker, chunker_id = structured.split, structured.chunker_id
+        else:
+            chunker = self._split_textbook
+            chunker_id = f"recursive:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+        if os.path.isdir(self.textbook_path):
+            index = CorpusIndex.load_or_update(
+                self.index_dir,
+                self.textbook_path,
+                chunker=chunker,
+                chunker_id=chunker_id,
+                get_embeddings=lambda: self.embeddings,
+                embedding_model=self.embedding_model,
+                index_factory=self.index_factory,
+            )
+            index.set_search_params(self.index_search_params)
+            print(
+                f"Loaded corpus with {len(index.documents)} documents and {len(index.chunks)} chunks"
+            )
+            return index
+        index = RetrievalIndex.load_or_build(
+            self.index_dir,
+            self.textbook_path,
+            chunker=chunker,
+            chunker_id=chunker_id,
+            get_embeddings=lambda: self.embeddings,
+            embedding_model=self.embedding_model,
+            index_factory=self.index_factory,
+        )
+        index.set_search_params(self.index_search_params)
+        print(f"Loaded textbook with {len(index.chunks)} chunks")
+        return index
 
-        with open(self.textbook_path, "r", encoding="utf-8") as f:
-            self.textbook_content = f.read()
+    def _load_vectorstore(self):
+        return self.index.as_vectorstore(self.embeddings)
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+    def _load_mathlib_index(self) -> Optional[RetrievalIndex]:
+        if self.mathlib_index_dir is None:
+            return None
+        index = load_mathlib_index(
+            self.mathlib_index_dir, self.embedding_model, self.repl_dir
         )
+        index.set_search_params(self.index_search_params)
+        print(f"Loaded Mathlib index with {len(index.chunks)} declarations")
+        return index
 
-        self.text_chunks = text_splitter.split_text(self.textbook_content)
-        print(f"Loaded textbook with {len(self.text_chunks)} chunks")
+    def _load_verifier(self) -> Optional[LeanVerifier]:
+        if self.lean_workers <= 0:
+            return None
+        cache_path = None
+        if self.persist_verification_cache:
+            cache_dir = os.path.join(self.repl_dir, ".lake")
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = os.path.join(cache_dir, "verification_cache.sqlite")
+        return LeanVerifier(
+            self.repl_dir,
+            num_workers=self.lean_workers,
+            timeout=self.lean_timeout,
+            cache_path=cache_path,
+        ).start()
 
-    def _initialize_retrieval_methods(self):
-        if BM25_AVAILABLE:
-            tokenized_chunks = [chunk.lower().split() for chunk in self.text_chunks]
-            self.bm25 = BM25Okapi(tokenized_chunks)
-            print("BM25 retrieval initialized")
-        else:
-            self.bm25 = None
-            print("BM25 not available - sparse retrieval disabled")
+    def _load_retrieval_cache(self) -> RetrievalCache:
+        content_hash = self.index.content_hash
+        if self.mathlib_index is not None:
+            content_hash = f"{content_hash}+{self.mathlib_index.content_hash}"
+        # Approximate indexes rank differently per factory and search
+        # parameters, which the content hash does not capture
+        search = f"{self.index_factory}:{self.index_search_params or ''}"
+        return RetrievalCache(
+            f"{content_hash}:{self.embedding_model}:{search}",
+            path=(
+                os.path.join(self.index_dir, "retrieval_cache.sqlite")
+                if self.persist_retrieval_cache
+                else None
+            ),
+        )
 
-        self.vectorstore = FAISS.from_texts(self.text_chunks, self.embeddings)
-        print("FAISS dense retrieval initialized")
+    def _source_index(self, source: str) -> RetrievalIndex:
+        if source == "textbook":
+            return self.index
+        if source == "mathlib":
+            if self.mathlib_index is None:
+                raise ValueError("No Mathlib index configured (pass mathlib_index)")
+            return self.mathlib_index
+        raise ValueError(f"Unknown retrieval source: {source}")
 
     def retrieve_context(
-        self, query: str, method: str = "hybrid", top_k: int = 5
+        self,
+        query: str,
+        method: str = "hybrid",
+        top_k: int = 5,
+        source: str = "textbook",
     ) -> List[str]:
+        return [
+            chunk
+            for chunk, _ in self.retrieve_scored_context(query, method, top_k, source)
+        ]
+
+    def retrieve_scored_context(
+        self,
+        query: str,
+        method: str = "hybrid",
+        top_k: int = 5,
+        source: str = "textbook",
+    ) -> List[Tuple[str, float]]:
+        return self._retrieve_with_timings(query, method, top_k, source)[0]
+
+    def _retrieve_with_timings(
+        self, query: str, method: str, top_k: int, source: str = "textbook"
+    ) -> Tuple[List[Tuple[str, float]], Dict[str, float], bool]:
+        """Retrieve (and optionally rerank) context for a query.
+
+        Returns the scored chunks, per-stage wall-clock seconds and whether
+        the reranker ran out of its time budget. Only textbook context is
+        reranked.
+        """
         if method == "no_rag":
-            return []
-        elif method == "bm25":
-            return self._bm25_retrieve(query, top_k)
-        elif method == "dense":
-            return self._dense_retrieve(query, top_k)
+            return [], {}, False
+
+        chunks = self._source_index(source).chunks
+        rerank = self.reranker is not None and source == "textbook"
+        timings = {}
+        start = time.perf_counter()
+        pool_size = max(top_k, self.rerank_candidates) if rerank else top_k
+        scored = self.retrieve_scored(query, method, pool_size, source)
+        timings["retrieval"] = time.perf_counter() - start
+
+        timed_out = False
+        if rerank:
+            start = time.perf_counter()
+            candidates = [(i, chunks[i], score) for i, score in scored]
+            scored, completed = self.reranker.rerank(query, candidates, top_k)
+            timings["rerank"] = time.perf_counter() - start
+            timed_out = not completed
+
+        context = [(chunks[i], score) for i, score in scored[:top_k]]
+        return context, timings, timed_out
+
+    def retrieve_facts(self, query: str, method: str = "hybrid") -> Tuple[List[str], float]:
+        """Mathlib declarations for a query and the seconds spent finding them.
+
+        Returns no facts when no Mathlib index is configured or for no_rag.
+        """
+        if self.mathlib_index_dir is None or method == "no_rag":
+            return [], 0.0
+        context, timings, _ = self._retrieve_with_timings(
+            query, method, self.mathlib_top_k, "mathlib"
+        )
+        return [fact for fact, _ in context], timings["retrieval"]
+
+    def retrieve_context_batch(
+        self, queries: List[str], method: str = "hybrid", top_k: int = 5
+    ) -> List[List[str]]:
+        return [
+            [chunk for chunk, _ in scored]
+            for scored in self.retrieve_scored_context_batch(queries, method, top_k)
+        ]
+
+    def retrieve_scored_context_batch(
+        self, queries: List[str], method: str = "hybrid", top_k: int = 5
+    ) -> List[List[Tuple[str, float]]]:
+        return [
+            context for context, _, _ in self._retrieve_batch_with_timings(
+                queries, method, top_k
+            )
+        ]
+
+    def _retrieve_batch_with_timings(
+        self, queries: List[str], method: str, top_k: int
+    ) -> List[Tuple[List[Tuple[str, float]], Dict[str, float], bool]]:
+        pool_size = max(top_k, self.rerank_candidates) if self.reranker else top_k
+        if method == "bm25":
+            self._bm25_prefetch(queries, pool_size)
         elif method == "hybrid":
-            return self._hybrid_retrieve(query, top_k)
-        else:
+            self._bm25_prefetch(queries, pool_size * HYBRID_OVERFETCH)
+        return [self._retrieve_with_timings(query, method, top_k) for query in queries]
+
+    def retrieve_ids(self, query: str, method: str = "hybrid", top_k: int = 5) -> List[int]:
+        return [i for i, _ in self.retrieve_scored(query, method, top_k)]
+
+    def retrieve_scored(
+        self,
+        query: str,
+        method: str = "hybrid",
+        top_k: int = 5,
+        source: str = "textbook",
+    ) -> ScoredIds:
+        if method not in RETRIEVAL_METHODS:
             raise ValueError(f"Unknown retrieval method: {method}")
+        if source not in RETRIEVAL_SOURCES:
+            raise ValueError(f"Unknown retrieval source: {source}")
+
+        cache_key = method
+        if method == "hybrid":
+            # Fused rankings depend on the fusion settings as well
+            weights = ",".join(f"{w:g}" for w in self.fusion_weights or (1.0, 1.0))
+            cache_key = f"hybrid:{self.fusion}:{weights}"
+        if source != "textbook":
+            cache_key = f"{source}:{cache_key}"
+        results = self.retrieval_cache.get_ranking(query, cache_key, top_k)
+        if results is None:
+            if method == "bm25":
+                results = self._bm25_retrieve(query, top_k, source)
+            elif method == "dense":
+                results = self._dense_retrieve(query, top_k, source)
+            else:
+                results = self._hybrid_retrieve(query, top_k, source)
+            self.retrieval_cache.put_ranking(query, cache_key, top_k, results)
+        return results
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        vector = self.retrieval_cache.get_embedding(query)
+        if vector is None:
+            vector = self.retrieval_cache.put_embedding(
+                query, self.embeddings.embed_query(query)
+            )
+        return vector
+
+    def _bm25_retrieve(self, query: str, top_k: int, source: str = "textbook") -> ScoredIds:
+        return self._source_index(source).bm25.top_k(tokenize(query), top_k)
+
+    def _bm25_prefetch(self, queries: List[str], top_k: int):
+        # Score every uncached query in one sparse matrix product and seed the
+        # retrieval cache, so the per-query lookups that follow are hits.
+        missing = list(
+            dict.fromkeys(
+                q
+                for q in queries
+                if self.retrieval_cache.get_ranking(q, "bm25", top_k) is None
+            )
+        )
+        if not missing:
+            return
+        results = self.bm25.top_k_batch([tokenize(q) for q in missing], top_k)
+        for query, ranked in zip(missing, results):
+            self.retrieval_cache.put_ranking(query, "bm25", top_k, ranked)
+
+    def _dense_retrieve(self, query: str, top_k: int, source: str = "textbook") -> ScoredIds:
+        if source != "textbook":
+            # Declaration indexes are searched directly; they are large
+            # enough that building a LangChain docstore over them is wasteful.
+            return self._source_index(source).search(self._embed_query(query), top_k)
+        docs = self.vectorstore.similarity_search_with_score_by_vector(
+            self._embed_query(query).tolist(), k=top_k
+        )
+        # FAISS returns L2 distances; negate so that higher is better like BM25
+        return [(doc.metadata["chunk_id"], -float(distance)) for doc, distance in docs]
+
+    def _hybrid_retrieve(self, query: str, top_k: int, source: str = "textbook") -> ScoredIds:
+        # Over-fetch so fusion can promote documents that both retrievers rank
+        # moderately well, and go through retrieve_scored so the single-method
+        # rankings are cached and shared with bm25/dense requests.
+        candidates = top_k * HYBRID_OVERFETCH
+        bm25_future = self.retrieval_executor.submit(
+            self.retrieve_scored, query, "bm25", candidates, source
+        )
+        dense_future = self.retrieval_executor.submit(
+            self.retrieve_scored, query, "dense", candidates, source
+        )
+
+        fused = fuse(
+            [bm25_future.result(), dense_future.result()],
+            method=self.fusion,
+            weights=self.fusion_weights,
+        )
+        return fused[:top_k]
 
-    def _bm25_retrieve(self, query: str, top_k: int) -> List[str]:
-        if not BM25_AVAILABLE or self.bm25 is None:
-            return self._dense_retrieve(query, top_k)
+    def build_prompt(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        facts: Optional[List[str]] = None,
+    ) -> PackedPrompt:
+        return self.prompt_builder.build(query, context, facts)
 
-        tokenized_query = query.lower().split()
-        scores = self.bm25.get_scores(tokenized_query)
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        return [self.text_chunks[i] for i in top_indices]
+    @staticmethod
+    def _length_buckets(
+        lengths: List[int], batch_size: int, max_padding_ratio: float = 1.5
+    ) -> List[List[int]]:
+        # Group prompts of similar length so that left-padding to the longest
+        # prompt in a batch wastes as little prefill compute as possible.
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        buckets = []
+        current = []
+        for i in order:
+            if current and (
+                len(current) >= batch_size
+                or lengths[i] > max_padding_ratio * max(lengths[current[0]], 1)
+            ):
+                buckets.append(current)
+                current = []
+            current.append(i)
+        if current:
+            buckets.append(current)
+        return buckets
 
-    def _dense_retrieve(self, query: str, top_k: int) -> List[str]:
-        docs = self.vectorstore.similarity_search(query, k=top_k)
-        return [doc.page_content for doc in docs]
+    def start_scheduler(self, max_batch_size: int = 8) -> GenerationScheduler:
+        """Route single-prompt generation through a continuous-batching loop.
 
-    def _hybrid_retrieve(self, query: str, top_k: int) -> List[str]:
-        if not BM25_AVAILABLE or self.bm25 is None:
-            return self._dense_retrieve(query, top_k)
+        Useful when prompts arrive concurrently from several threads (e.g. the
+        formalization server): each call joins the running batch as soon as a
+        slot is free rather than waiting for the model.
+        """
+        if self.speculation_enabled:
+            raise ValueError("Speculative decoding does not support continuous batching")
+        if self.num_candidates > 1:
+            raise ValueError("Best-of-N sampling does not support continuous batching")
+        if self.scheduler is None:
+            self.scheduler = GenerationScheduler(
+                self.model,
+                self.tokenizer,
+                max_batch_size=max_batch_size,
+                prefix_cache=self.prefix_cache,
+                stop_at_code_end=self.stop_at_code_end,
+            ).start()
+        return self.scheduler
 
-        bm25_results = self._bm25_retrieve(query, top_k)
-        dense_results = self._dense_retrieve(query, top_k)
+    def stop_scheduler(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
 
-        combined = list(dict.fromkeys(bm25_results + dense_results))
-        return combined[:top_k]
+    def close(self):
+        """Stop the scheduler and any Lean REPL workers."""
+        self.stop_scheduler()
+        if self._components.loaded("verifier") and self.verifier is not None:
+            self.verifier.close()
 
     def generate_lean_code(
-        self, query: str, context: Optional[List[str]] = None, max_new_tokens: int = 2048
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        max_new_tokens: int = 2048,
+        client: str = "default",
+        facts: Optional[List[str]] = None,
     ) -> str:
-        if context:
-            context_text = "\n\n".join(context)
-            prompt = f"""Given the following mathematical context:
+        return self._generate_packed(
+            self.build_prompt(query, context, facts), max_new_tokens, client
+        )
 
-{context_text}
+    def _generate_packed(
+        self,
+        packed: PackedPrompt,
+        max_new_tokens: int = 2048,
+        client: str = "default",
+        timeout: Optional[float] = None,
+    ) -> str:
+        if self.scheduler is not None:
+            future = self.scheduler.submit_ids(
+                packed.input_ids,
+                max_new_tokens,
+                client,
+                packed.prefix_lengths,
+                timeout=timeout,
+            )
+            return future.result()
+        return self._generate_single(packed, max_new_tokens, timeout=timeout)
 
-Please formalize the following statement in Lean 4:
+    def stream_lean_code(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        max_new_tokens: int = 2048,
+        client: str = "default",
+        facts: Optional[List[str]] = None,
+    ) -> Iterator[str]:
+        """Yield the generated Lean code incrementally as it is decoded.
 
-{query}
+        Closing the iterator early (e.g. when an HTTP client disconnects)
+        stops generation at the next decode step.
+        """
+        packed = self.build_prompt(query, context, facts)
+        tokens = TokenQueue()
+        cancel = Event()
 
-Provide only the Lean 4 code without any explanations:"""
+        if self.scheduler is not None:
+            self.scheduler.submit_ids(
+                packed.input_ids,
+                max_new_tokens,
+                client,
+                packed.prefix_lengths,
+                tokens,
+                cancel=cancel,
+            )
         else:
-            prompt = f"""Please formalize the following mathematical statement in Lean 4:
+            Thread(
+                target=self._generate_into,
+                args=(packed, max_new_tokens, tokens, cancel),
+                daemon=True,
+            ).start()
 
-{query}
+        try:
+            # Leading whitespace is stripped to match generate_lean_code
+            started = False
+            for text in decode_incrementally(
+                self.tokenizer, iter(tokens), self.tokenizer.eos_token_id
+            ):
+                if not started:
+                    text = text.lstrip()
+                    started = bool(text)
+                if text:
+                    yield text
+        finally:
+            cancel.set()
 
-Provide only the Lean 4 code without any explanations:"""
+    def _generate_into(
+        self,
+        packed: PackedPrompt,
+        max_new_tokens: int,
+        tokens: TokenQueue,
+        cancel: Optional[Event] = None,
+    ):
+        try:
+            self._generate_single(
+                packed, max_new_tokens, QueueStreamer(tokens), cancel=cancel
+            )
+        except Exception as e:
+            tokens.close(e)
 
-        inputs = self.tokenizer(
-            prompt, return_tensors="pt", truncation=True, max_length=2048
-        )
+    def generate_lean_code_batch(
+        self,
+        queries: List[str],
+        contexts: Optional[List[Optional[List[str]]]] = None,
+        max_new_tokens: int = 2048,
+        batch_size: int = 8,
+    ) -> List[str]:
+        if contexts is None:
+            contexts = [None] * len(queries)
+        if len(contexts) != len(queries):
+            raise ValueError("queries and contexts must have the same length")
+
+        prompts = [self.build_prompt(q, c) for q, c in zip(queries, contexts)]
+        return self.generate_from_prompts(prompts, max_new_tokens, batch_size)
+
+    def generate_from_prompts(
+        self,
+        prompts: List[PackedPrompt],
+        max_new_tokens: int = 2048,
+        batch_size: int = 8,
+    ) -> List[str]:
+        lengths = [len(p.input_ids) for p in prompts]
+        if self.speculative is not None:
+            # Assisted generation verifies one sequence at a time
+            batch_size = 1
 
         device = next(self.model.parameters()).device
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+        results = [""] * len(prompts)
 
-        with torch.no_grad():
-            outputs = self.model.generate(
-                inputs["input_ids"],
-                max_new_tokens=max_new_tokens,  # Generate at most 2048 new tokens
-                temperature=0.1,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,  # Stop at EOS token
+        for bucket in self._length_buckets(lengths, batch_size):
+            if len(bucket) == 1 and (
+                self.prefix_cache is not None or self.speculative is not None
+            ):
+                # Prefix reuse and assisted generation need an unpadded row,
+                # so they only apply to prompts generated on their own.
+                results[bucket[0]] = self._generate_single(
+                    prompts[bucket[0]], max_new_tokens
+                )
+                continue
+
+            inputs = self.tokenizer.pad(
+                {"input_ids": [prompts[i].input_ids for i in bucket]},
+                padding=True,
+                return_tensors="pt",
+            )
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=max_new_tokens,  # Generate at most 2048 new tokens
+                    temperature=0.1,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    eos_token_id=self.tokenizer.eos_token_id,  # Stop at EOS token
+                    stopping_criteria=self._stopping_criteria(
+                        inputs["input_ids"].shape[1]
+                    ),
+                )
+
+            # Prompts are left-padded, so generated tokens start at the same
+            # offset for every row in the batch.
+            new_tokens = outputs[:, inputs["input_ids"].shape[1] :]
+            decoded = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            for i, text in zip(bucket, decoded):
+                results[i] = extract_lean_code(text)
+
+        return results
+
+    def _generate_single(
+        self,
+        packed: PackedPrompt,
+        max_new_tokens: int,
+        streamer=None,
+        timeout: Optional[float] = None,
+        cancel: Optional[Event] = None,
+    ) -> str:
+        start = time.perf_counter()
+        past_key_values = None
+        if self.prefix_cache is not None:
+            past_key_values, _ = self.prefix_cache.prefill(
+                self.model, packed.input_ids, packed.prefix_lengths
             )
 
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        lean_code = generated_text[len(prompt) :].strip()
-        return lean_code
+        device = next(self.model.parameters()).device
+        input_ids = torch.tensor([packed.input_ids], device=device)
+        kwargs = dict(
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            temperature=0.1,
+            do_sample=True,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            stopping_criteria=self._stopping_criteria(input_ids.shape[1], cancel),
+            streamer=streamer,
+            # Checked between decode steps, so generation stops cooperatively
+            max_time=timeout,
+        )
+        with torch.no_grad():
+            if self.speculative is not None:
+                outputs = self.speculative.generate(self.model, input_ids, **kwargs)
+            else:
+                outputs = self.model.generate(input_ids, **kwargs)
+        if timeout is not None and time.perf_counter() - start >= timeout:
+            raise TimeoutError(f"Generation timed out after {timeout:g}s")
+
+        new_tokens = outputs[0, input_ids.shape[1] :]
+        return extract_lean_code(
+            self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+        )
+
+    def generate_and_verify(
+        self,
+        packed: PackedPrompt,
+        max_new_tokens: int = 2048,
+        timeout: Optional[float] = None,
+    ) -> Tuple[str, VerificationResult, Dict[str, float], int]:
+        """Sample ``num_candidates`` candidates and return the first that compiles.
+
+        The candidates come from one batched ``generate`` call. Each one is
+        type-checked as soon as its code is complete, while the others are
+        still decoding. The first compiling candidate stops generation and
+        cancels the remaining checks. Without a compiling candidate, the one
+        with the fewest errors is returned.
+
+        Returns the code, its verification result, timings for the
+        generation and the checks left after it, and the number of completed
+        checks.
+        """
+        start = time.perf_counter()
+        device = next(self.model.parameters()).device
+        input_ids = torch.tensor([packed.input_ids], device=device)
+        checker = CandidateChecker(
+            self.tokenizer,
+            self.verifier,
+            input_ids.shape[1],
+            self.num_candidates,
+            stop_at_code_end=self.stop_at_code_end,
+        )
+        try:
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    num_return_sequences=self.num_candidates,
+                    temperature=CANDIDATE_TEMPERATURE,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([checker]),
+                    max_time=timeout,
+                )
+        except Exception:
+            checker.abandon()
+            raise
+        generation_time = time.perf_counter() - start
+        if timeout is not None and generation_time >= timeout and checker.winner is None:
+            checker.abandon()
+            raise TimeoutError(f"Generation timed out after {timeout:g}s")
+
+        start = time.perf_counter()
+        texts = self.tokenizer.batch_decode(
+            outputs[:, input_ids.shape[1] :], skip_special_tokens=True
+        )
+        row, verification = checker.finish(texts)
+        timings = {
+            "generation": generation_time,
+            # Checks overlap generation; this is only the wait after it
+            "verification": time.perf_counter() - start,
+        }
+        return extract_lean_code(texts[row]), verification, timings, checker.checked
+
+    def _stopping_criteria(
+        self, prompt_length: int, cancel: Optional[Event] = None
+    ) -> Optional[StoppingCriteriaList]:
+        criteria = []
+        if self.stop_at_code_end:
+            criteria.append(LeanCodeStoppingCriteria(self.tokenizer, prompt_length))
+        if cancel is not None:
+            criteria.append(CancelStoppingCriteria(cancel))
+        return StoppingCriteriaList(criteria) if criteria else None
 
     def formalize_with_rag(
-        self, query: str, method: str = "hybrid", top_k: int = 5
+        self,
+        query: str,
+        method: str = "hybrid",
+        top_k: int = 5,
+        client: str = "default",
+        timeout: Optional[float] = None,
     ) -> Tuple[str, RAGMetrics]:
-        context = self.retrieve_context(query, method, top_k)
-        lean_code = self.generate_lean_code(query, context)
+        """Retrieve context and generate Lean code for one query.
+
+        ``method="no_rag"`` skips retrieval. ``timeout`` bounds generation
+        and raises TimeoutError when it is exceeded.
+        """
+        scored_context, timings, rerank_timed_out = self._retrieve_with_timings(
+            query, method, top_k
+        )
+        context = [chunk for chunk, _ in scored_context]
+        facts, fact_time = self.retrieve_facts(query, method)
+        if facts:
+            timings["mathlib_retrieval"] = fact_time
+        packed = self.build_prompt(query, context, facts)
+
+        verification = None
+        candidates_checked = 0
+        if self.num_candidates > 1:
+            lean_code, verification, candidate_timings, candidates_checked = (
+                self.generate_and_verify(packed, timeout=timeout)
+            )
+            timings.update(candidate_timings)
+        else:
+            start = time.perf_counter()
+            lean_code = self._generate_packed(packed, client=client, timeout=timeout)
+            timings["generation"] = time.perf_counter() - start
+
+            if self.lean_workers > 0:
+                start = time.perf_counter()
+                verification = self.verify(lean_code)
+                timings["verification"] = time.perf_counter() - start
+                candidates_checked = 1
 
         metrics = RAGMetrics(
             mrr=0.0,
             top_k_recall={k: 0.0 for k in [1, 3, 5]},
             retrieved_contexts=context,
             query=query,
+            retrieval_scores=[score for _, score in scored_context],
+            stage_timings=timings,
+            rerank_timed_out=rerank_timed_out,
+            context_tokens=packed.context_tokens,
+            context_chunks_used=len(packed.context_chunks),
+            retrieved_facts=packed.facts,
+            verification=verification,
+            candidates=self.num_candidates,
+            candidates_checked=candidates_checked,
         )
 
         return lean_code, metrics
 
     def formalize_without_rag(self, query: str) -> str:
         return self.generate_lean_code(query, context=None)
+
+    def formalize_batch(
+        self, queries: List[str], method: str = "hybrid", top_k: int = 5
+    ) -> List[Tuple[str, RAGMetrics]]:
+        if self.num_candidates > 1:
+            # Each query's candidates already fill a generation batch
+            return [self.formalize_with_rag(q, method, top_k) for q in queries]
+
+        retrieved = self._retrieve_batch_with_timings(queries, method, top_k)
+        contexts = [[chunk for chunk, _ in scored] for scored, _, _ in retrieved]
+        facts = []
+        for query, (_, timings, _) in zip(queries, retrieved):
+            query_facts, fact_time = self.retrieve_facts(query, method)
+            if query_facts:
+                timings["mathlib_retrieval"] = fact_time
+            facts.append(query_facts)
+        prompts = [
+            self.build_prompt(q, c, f) for q, c, f in zip(queries, contexts, facts)
+        ]
+
+        start = time.perf_counter()
+        lean_codes = self.generate_from_prompts(prompts)
+        # Generation is shared by the whole batch, so each query reports the
+        # batch's wall-clock time.
+        generation_time = time.perf_counter() - start
+
+        verifications = [None] * len(queries)
+        verification_time = None
+        if self.lean_workers > 0:
+            start = time.perf_counter()
+            verifications = self.verify_many(lean_codes)
+            verification_time = time.perf_counter() - start
+
+        return [
+            (
+                lean_code,
+                RAGMetrics(
+                    mrr=0.0,
+                    top_k_recall={k: 0.0 for k in [1, 3, 5]},
+                    retrieved_contexts=context,
+                    query=query,
+                    retrieval_scores=[score for _, score in scored],
+                    stage_timings={
+                        **timings,
+                        "generation": generation_time,
+                        **(
+                            {"verification": verification_time}
+                            if verification_time is not None
+                            else {}
+                        ),
+                    },
+                    rerank_timed_out=rerank_timed_out,
+                    context_tokens=packed.context_tokens,
+                    context_chunks_used=len(packed.context_chunks),
+                    retrieved_facts=packed.facts,
+                    verification=verification,
+                    candidates_checked=int(verification is not None),
+                ),
+            )
+            for query, context, packed, lean_code, verification, (
+                scored,
+                timings,
+                rerank_timed_out,
+            ) in zip(queries, contexts, prompts, lean_codes, verifications, retrieved)
+        ]
+
+    def verify(self, lean_code: str) -> VerificationResult:
+        """Type-check Lean code with the pipeline's REPL pool."""
+        if self.lean_workers <= 0:
+            raise ValueError("Verification is disabled; set lean_workers > 0")
+        return self.verifier.verify(lean_code)
+
+    def verify_many(self, lean_codes: List[str]) -> List[VerificationResult]:
+        if self.lean_workers <= 0:
+            raise ValueError("Verification is disabled; set lean_workers > 0")
+        return self.verifier.verify_many(lean_codes)
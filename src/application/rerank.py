@@ -0,0 +1,83 @@
+import time
+from typing import List, Optional, Tuple
+
+from src.application.fusion import ScoredIds
+
+DEFAULT_RERANKER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Rescores a first-stage candidate pool with a small cross-encoder.
+
+    Candidates are scored in batches on CPU. If the per-query time budget
+    runs out before the last batch is scored, including during it, the
+    first-stage order is kept and the query is reported as timed out.
+    Scoring stops at the first batch boundary past the budget, so a query
+    overruns it by at most one batch.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANKER,
+        batch_size: int = 16,
+        budget_ms: Optional[float] = 200.0,
+        device: str = "cpu",
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.device = device
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            print(f"Loading reranker: {self.model_name}")
+            self._model = CrossEncoder(self.model_name, device=self.device)
+        return self._model
+
+    def rerank(
+        self, query: str, candidates: List[Tuple[int, str, float]], top_k: int
+    ) -> Tuple[ScoredIds, bool]:
+        """Return the reranked top_k and whether reranking completed in budget.
+
+        ``candidates`` are ``(chunk_id, text, first_stage_score)`` in
+        first-stage order.
+        """
+        fallback = [(chunk_id, score) for chunk_id, _, score in candidates[:top_k]]
+        if not candidates:
+            return fallback, True
+
+        model = self.model
+        start = time.perf_counter()
+
+        def over_budget() -> bool:
+            return (
+                self.budget_ms is not None
+                and (time.perf_counter() - start) * 1000 > self.budget_ms
+            )
+
+        scores: List[float] = []
+        for offset in range(0, len(candidates), self.batch_size):
+            if over_budget():
+                return fallback, False
+            batch = candidates[offset : offset + self.batch_size]
+            scores.extend(
+                float(s)
+                for s in model.predict(
+                    [(query, text) for _, text, _ in batch],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False,
+                )
+            )
+        if over_budget():
+            return fallback, False
+
+        reranked = sorted(
+            zip((chunk_id for chunk_id, _, _ in candidates), scores),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return reranked[:top_k], True
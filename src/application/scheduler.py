@@ -0,0 +1,382 @@
+import threading
+import itertools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import torch
+from transformers import DynamicCache
+
+from src.application.prefix_cache import PrefixKVCache
+from src.application.lean_code import GeneratedText, extract_lean_code
+from src.application.streaming import TokenQueue
+
+
+@dataclass
+class GenerationRequest:
+    request_id: int
+    client: str
+    input_ids: List[int]
+    max_new_tokens: int
+    future: Future
+    prefix_lengths: List[int] = field(default_factory=list)
+    tokens: Optional[TokenQueue] = None
+    generated: List[int] = field(default_factory=list)
+    # Decoded incrementally for the code-end check
+    text: Optional[GeneratedText] = None
+    # time.monotonic() after which the request fails with TimeoutError
+    deadline: Optional[float] = None
+    # Set by the caller to drop the request, e.g. when its stream is closed
+    cancel: Optional[threading.Event] = None
+
+
+class GenerationScheduler:
+    """Continuous-batching decode loop around a causal LM.
+
+    Requests are admitted into the running batch whenever a slot frees up,
+    instead of waiting for the longest sequence of a static batch to finish.
+    Each request stops independently on EOS, its own ``max_new_tokens``, or
+    (with ``stop_at_code_end``) once its Lean code block is complete.
+    Waiting requests are queued per client and admitted round-robin so one
+    client submitting many prompts cannot starve the others. A request with
+    a timeout is checked between decode steps and fails with TimeoutError
+    once its deadline passes, freeing its slot for the next request. A
+    request whose ``cancel`` event is set is dropped the same way.
+
+    The running batch is kept left-padded: every row's KV cache is aligned
+    on the right, with padding columns masked out through the attention
+    mask, so a single forward pass decodes one token for every active row.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_batch_size: int = 8,
+        temperature: float = 0.1,
+        prefix_cache: Optional[PrefixKVCache] = None,
+        stop_at_code_end: bool = False,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.temperature = temperature
+        self.prefix_cache = prefix_cache
+        self.stop_at_code_end = stop_at_code_end
+        self.eos_token_id = tokenizer.eos_token_id
+        self.device = next(model.parameters()).device
+
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # Running batch state
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[Tuple[Tuple[torch.Tensor, torch.Tensor], ...]] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._positions: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+
+    def start(self) -> "GenerationScheduler":
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(
+        self, prompt: str, max_new_tokens: int = 2048, client: str = "default"
+    ) -> Future:
+        """Queue a prompt string; it is tokenized as is, without truncation.
+
+        Prompts are expected to be sized by PromptBuilder, which keeps them
+        within the token budget by dropping whole context chunks.
+        """
+        input_ids = self.tokenizer(prompt)["input_ids"]
+        return self.submit_ids(input_ids, max_new_tokens, client)
+
+    def submit_ids(
+        self,
+        input_ids: List[int],
+        max_new_tokens: int = 2048,
+        client: str = "default",
+        prefix_lengths: Optional[List[int]] = None,
+        tokens: Optional[TokenQueue] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Future:
+        """Queue a prompt; the future resolves to the decoded completion.
+
+        If ``tokens`` is given, every generated token id is also pushed to it
+        as soon as it is sampled, and it is closed when the request finishes.
+        ``timeout`` counts from submission, including time spent queued.
+        Setting ``cancel`` drops the request at the next decode step.
+        """
+        future = Future()
+        request = GenerationRequest(
+            request_id=next(self._ids),
+            client=client,
+            input_ids=list(input_ids),
+            max_new_tokens=max_new_tokens,
+            future=future,
+            prefix_lengths=list(prefix_lengths or []),
+            tokens=tokens,
+            deadline=time.monotonic() + timeout if timeout is not None else None,
+            cancel=cancel,
+            text=GeneratedText(self.tokenizer) if self.stop_at_code_end else None,
+        )
+        if tokens is not None:
+            future.add_done_callback(
+                lambda f: tokens.close(None if f.cancelled() else f.exception())
+            )
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Scheduler is not running")
+            self._queues.setdefault(client, deque()).append(request)
+            self._condition.notify()
+        return future
+
+    def pending(self) -> int:
+        with self._condition:
+            return sum(len(q) for q in self._queues.values())
+
+    def _next_request(self) -> Optional[GenerationRequest]:
+        # Round-robin over clients: take the head of the first non-empty
+        # queue and move that client to the back of the order.
+        for client in list(self._queues):
+            queue = self._queues[client]
+            if queue:
+                request = queue.popleft()
+                self._queues.move_to_end(client)
+                return request
+            del self._queues[client]
+        return None
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self._active and not any(
+                    self._queues.values()
+                ):
+                    self._condition.wait()
+                if not self._running:
+                    break
+
+                admitted = []
+                while len(self._active) + len(admitted) < self.max_batch_size:
+                    request = self._next_request()
+                    if request is None:
+                        break
+                    admitted.append(request)
+
+            for request in admitted:
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                if self._cancelled(request):
+                    self._fail_cancelled(request)
+                    continue
+                if self._expired(request):
+                    self._fail_expired(request)
+                    continue
+                try:
+                    self._admit(request)
+                except Exception as e:
+                    request.future.set_exception(e)
+
+            try:
+                if self._active:
+                    self._step()
+            except Exception as e:
+                for request in self._active:
+                    request.future.set_exception(e)
+                self._reset_batch()
+
+        for request in self._active:
+            request.future.set_exception(RuntimeError("Scheduler stopped"))
+        self._reset_batch()
+        with self._condition:
+            for queue in self._queues.values():
+                for request in queue:
+                    request.future.cancel()
+            self._queues.clear()
+
+    def _reset_batch(self):
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        self._positions = None
+        self._next_tokens = None
+
+    def _sample(self, logits: torch.Tensor) -> torch.Tensor:
+        if self.temperature <= 0:
+            return logits.argmax(dim=-1)
+        probs = torch.softmax(logits.float() / self.temperature, dim=-1)
+        return torch.multinomial(probs, num_samples=1).squeeze(-1)
+
+    @torch.no_grad()
+    def _admit(self, request: GenerationRequest):
+        past_key_values, start = None, 0
+        if self.prefix_cache is not None:
+            past_key_values, start = self.prefix_cache.prefill(
+                self.model, request.input_ids, request.prefix_lengths
+            )
+
+        input_ids = torch.tensor([request.input_ids], device=self.device)
+        outputs = self.model(
+            input_ids=input_ids[:, start:],
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        cache = outputs.past_key_values
+        if isinstance(cache, DynamicCache):
+            cache = cache.to_legacy_cache()
+
+        next_token = self._sample(outputs.logits[:, -1, :])
+        self._emit(request, next_token.item())
+        if self._finished(request):
+            self._complete(request)
+            return
+
+        mask = torch.ones((1, input_ids.shape[1]), dtype=torch.long, device=self.device)
+        position = torch.tensor([input_ids.shape[1]], device=self.device)
+
+        if not self._active:
+            self._cache = cache
+            self._attention_mask = mask
+            self._positions = position
+            self._next_tokens = next_token
+        else:
+            self._merge(cache, mask)
+            self._positions = torch.cat([self._positions, position])
+            self._next_tokens = torch.cat([self._next_tokens, next_token])
+        self._active.append(request)
+
+    def _merge(self, cache, mask: torch.Tensor):
+        length = max(self._attention_mask.shape[1], mask.shape[1])
+
+        def left_pad(tensor: torch.Tensor, dim: int) -> torch.Tensor:
+            missing = length - tensor.shape[dim]
+            if missing == 0:
+                return tensor
+            shape = list(tensor.shape)
+            shape[dim] = missing
+            return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+        self._cache = tuple(
+            (
+                torch.cat([left_pad(k, 2), left_pad(new_k, 2)]),
+                torch.cat([left_pad(v, 2), left_pad(new_v, 2)]),
+            )
+            for (k, v), (new_k, new_v) in zip(self._cache, cache)
+        )
+        self._attention_mask = torch.cat(
+            [left_pad(self._attention_mask, 1), left_pad(mask, 1)]
+        )
+
+    @torch.no_grad()
+    def _step(self):
+        mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))],
+            dim=1,
+        )
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=mask,
+            position_ids=self._positions.unsqueeze(-1),
+            past_key_values=DynamicCache.from_legacy_cache(self._cache),
+            use_cache=True,
+        )
+        cache = outputs.past_key_values
+        if isinstance(cache, DynamicCache):
+            cache = cache.to_legacy_cache()
+
+        self._cache = cache
+        self._attention_mask = mask
+        self._positions = self._positions + 1
+        self._next_tokens = self._sample(outputs.logits[:, -1, :])
+
+        keep = []
+        for row, (request, token) in enumerate(
+            zip(self._active, self._next_tokens.tolist())
+        ):
+            self._emit(request, token)
+            if self._finished(request):
+                self._complete(request)
+            elif self._cancelled(request):
+                self._fail_cancelled(request)
+            elif self._expired(request):
+                self._fail_expired(request)
+            else:
+                keep.append(row)
+
+        if len(keep) < len(self._active):
+            self._evict(keep)
+
+    def _evict(self, keep: List[int]):
+        if not keep:
+            self._reset_batch()
+            return
+
+        rows = torch.tensor(keep, device=self.device)
+        mask = self._attention_mask.index_select(0, rows)
+        # Drop leading columns that are padding for every remaining row
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+
+        self._cache = tuple(
+            (k.index_select(0, rows)[:, :, start:], v.index_select(0, rows)[:, :, start:])
+            for k, v in self._cache
+        )
+        self._attention_mask = mask[:, start:]
+        self._positions = self._positions.index_select(0, rows)
+        self._next_tokens = self._next_tokens.index_select(0, rows)
+        self._active = [self._active[i] for i in keep]
+
+    def _emit(self, request: GenerationRequest, token: int):
+        request.generated.append(token)
+        if request.tokens is not None:
+            request.tokens.put(token)
+
+    def _finished(self, request: GenerationRequest) -> bool:
+        if (
+            request.generated[-1] == self.eos_token_id
+            or len(request.generated) >= request.max_new_tokens
+        ):
+            return True
+        if request.text is None:
+            return False
+        request.text.extend(request.generated[-1:])
+        return request.text.complete
+
+    def _expired(self, request: GenerationRequest) -> bool:
+        return request.deadline is not None and time.monotonic() > request.deadline
+
+    def _cancelled(self, request: GenerationRequest) -> bool:
+        return request.cancel is not None and request.cancel.is_set()
+
+    def _fail_cancelled(self, request: GenerationRequest):
+        request.future.set_exception(
+            CancelledError(f"Generation cancelled after {len(request.generated)} tokens")
+        )
+
+    def _fail_expired(self, request: GenerationRequest):
+        request.future.set_exception(
+            TimeoutError(
+                f"Generation timed out after {len(request.generated)} tokens"
+            )
+        )
+
+    def _complete(self, request: GenerationRequest):
+        text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        request.future.set_result(extract_lean_code(text))
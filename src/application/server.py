@@ -0,0 +1,167 @@
+import json
+import contextlib
+import threading
+from typing import Iterator, List, Optional
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.application.rag import MathematicalRAGPipeline
+from src.application.client import DEFAULT_HOST, DEFAULT_PORT
+
+
+class FormalizationServer:
+    """Keeps a MathematicalRAGPipeline resident and serves it over HTTP.
+
+    Requests are handled on separate threads. With ``max_batch_size`` set,
+    concurrent requests share the pipeline's continuous-batching scheduler;
+    otherwise (or with speculative decoding or best-of-N sampling, which
+    cannot join a shared batch) generation is serialized with a lock, since the model is not safe to
+    call concurrently.
+    """
+
+    def __init__(
+        self,
+        pipeline: MathematicalRAGPipeline,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_batch_size: Optional[int] = None,
+    ):
+        self.pipeline = pipeline
+        if max_batch_size and pipeline.speculation_enabled:
+            print("Speculative decoding is enabled; serving requests one at a time")
+            max_batch_size = None
+        if max_batch_size and pipeline.num_candidates > 1:
+            print("Best-of-N sampling is enabled; serving requests one at a time")
+            max_batch_size = None
+        if max_batch_size:
+            pipeline.start_scheduler(max_batch_size)
+            self.lock = contextlib.nullcontext()
+        else:
+            self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send(
+                        200,
+                        {
+                            "status": "ok",
+                            "model": server.pipeline.model_name,
+                            "textbook": server.pipeline.textbook_path,
+                            "chunker": server.pipeline.chunker,
+                            "index_factory": server.pipeline.index_factory,
+                            "mathlib_index": server.pipeline.mathlib_index_dir,
+                            "verify": server.pipeline.lean_workers > 0,
+                            "candidates": server.pipeline.num_candidates,
+                            "speculation": (
+                                server.pipeline.speculative.stats()
+                                if server.pipeline.speculation_enabled
+                                else None
+                            ),
+                        },
+                    )
+                else:
+                    self._send(404, {"error": f"Unknown path: {self.path}"})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    if self.path == "/stream_lean_code":
+                        self._stream(payload)
+                        return
+                    self._send(200, server.handle(self.path, payload))
+                except KeyError as e:
+                    self._send(400, {"error": f"Missing field: {e}"})
+                except ValueError as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:
+                    self._send(500, {"error": str(e)})
+
+            def _send(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, payload: dict):
+                # Newline-delimited JSON: one {"text": ...} object per decoded
+                # piece, then {"done": true} or {"error": ...}.
+                query = payload["query"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for text in server.stream(
+                        query, payload.get("context"), payload.get("facts")
+                    ):
+                        self._write_line({"text": text})
+                    self._write_line({"done": True})
+                except Exception as e:
+                    self._write_line({"error": str(e)})
+
+            def _write_line(self, body: dict):
+                self.wfile.write(json.dumps(body).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                print(f"[server] {self.address_string()} {format % args}")
+
+        return Handler
+
+    def handle(self, path: str, payload: dict) -> dict:
+        if path == "/formalize_with_rag":
+            with self.lock:
+                lean_code, metrics = self.pipeline.formalize_with_rag(
+                    payload["query"],
+                    method=payload.get("method", "hybrid"),
+                    top_k=payload.get("top_k", 5),
+                )
+            return {"lean_code": lean_code, "metrics": asdict(metrics)}
+        elif path == "/retrieve_context":
+            context = self.pipeline.retrieve_context(
+                payload["query"],
+                method=payload.get("method", "hybrid"),
+                top_k=payload.get("top_k", 5),
+                source=payload.get("source", "textbook"),
+            )
+            return {"context": context}
+        elif path == "/retrieve_facts":
+            facts, seconds = self.pipeline.retrieve_facts(
+                payload["query"], method=payload.get("method", "hybrid")
+            )
+            return {"facts": facts, "seconds": seconds}
+        elif path == "/formalize_without_rag":
+            with self.lock:
+                lean_code = self.pipeline.formalize_without_rag(payload["query"])
+            return {"lean_code": lean_code}
+        else:
+            raise ValueError(f"Unknown path: {path}")
+
+    def stream(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        facts: Optional[List[str]] = None,
+    ) -> Iterator[str]:
+        with self.lock:
+            yield from self.pipeline.stream_lean_code(query, context, facts=facts)
+
+    def serve_forever(self):
+        host, port = self.httpd.server_address[:2]
+        print(f"Formalization server listening on http://{host}:{port}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.pipeline.close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
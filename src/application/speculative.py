@@ -0,0 +1,131 @@
+import threading
+from typing import Optional
+
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+
+class StepCounter(BaseStreamer):
+    """Counts verification steps of an assisted ``generate`` call.
+
+    Assisted generation emits the accepted draft tokens plus one token from
+    the target model after every target forward pass, so each ``put`` after
+    the prompt is one verification step. Puts are forwarded to ``inner``.
+    """
+
+    def __init__(self, inner: Optional[BaseStreamer] = None):
+        self.inner = inner
+        self.steps = 0
+        self.tokens = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        if self._prompt_seen:
+            self.steps += 1
+            self.tokens += value.numel()
+        self._prompt_seen = True
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def end(self):
+        if self.inner is not None:
+            self.inner.end()
+
+
+class SpeculativeDecoder:
+    """Assisted decoding for the prover, with acceptance statistics.
+
+    Tokens are proposed either by a small ``draft_model`` or, without one, by
+    n-gram lookup in the prompt (``prompt_lookup_tokens`` per step), which
+    works well here because generated Lean code often repeats names from
+    the statement and the retrieved context. The target model verifies every
+    proposal in a single forward pass, so the output distribution is that of
+    the target model alone.
+
+    Assisted generation only supports one sequence at a time.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        draft_model=None,
+        draft_tokenizer=None,
+        prompt_lookup_tokens: int = 10,
+    ):
+        if draft_model is None and prompt_lookup_tokens <= 0:
+            raise ValueError("Speculative decoding needs a draft model or prompt lookup")
+        self.tokenizer = tokenizer
+        self.draft_model = draft_model
+        self.draft_tokenizer = draft_tokenizer
+        self.prompt_lookup_tokens = prompt_lookup_tokens
+
+        self.generations = 0
+        self.generated_tokens = 0
+        self.verification_steps = 0
+        self.drafted_tokens = 0
+        self._lock = threading.Lock()
+
+        if draft_model is not None:
+            # Every draft forward pass proposes exactly one token
+            draft_model.register_forward_hook(self._count_draft)
+
+    @property
+    def mode(self) -> str:
+        return "draft" if self.draft_model is not None else "prompt_lookup"
+
+    def _count_draft(self, module, args, output):
+        with self._lock:
+            self.drafted_tokens += 1
+
+    def _generate_kwargs(self) -> dict:
+        if self.draft_model is None:
+            return {"prompt_lookup_num_tokens": self.prompt_lookup_tokens}
+        kwargs = {"assistant_model": self.draft_model}
+        if (
+            self.draft_tokenizer is not None
+            and self.draft_tokenizer.get_vocab() != self.tokenizer.get_vocab()
+        ):
+            # Different vocabularies need token translation between the models
+            kwargs["tokenizer"] = self.tokenizer
+            kwargs["assistant_tokenizer"] = self.draft_tokenizer
+        return kwargs
+
+    @torch.no_grad()
+    def generate(
+        self, model, input_ids: torch.Tensor, streamer: Optional[BaseStreamer] = None, **kwargs
+    ) -> torch.Tensor:
+        if input_ids.shape[0] != 1:
+            raise ValueError("Speculative decoding only supports one prompt at a time")
+
+        counter = StepCounter(streamer)
+        outputs = model.generate(
+            input_ids, streamer=counter, **self._generate_kwargs(), **kwargs
+        )
+        with self._lock:
+            self.generations += 1
+            self.generated_tokens += counter.tokens
+            self.verification_steps += counter.steps
+        return outputs
+
+    def stats(self) -> dict:
+        with self._lock:
+            accepted = self.generated_tokens - self.verification_steps
+            return {
+                "mode": self.mode,
+                "generations": self.generations,
+                "generated_tokens": self.generated_tokens,
+                "verification_steps": self.verification_steps,
+                "accepted_tokens": accepted,
+                "tokens_per_step": (
+                    self.generated_tokens / self.verification_steps
+                    if self.verification_steps
+                    else 0.0
+                ),
+                # Prompt lookup proposals are not observable, so the
+                # acceptance rate is only known with a draft model.
+                "acceptance_rate": (
+                    accepted / self.drafted_tokens
+                    if self.draft_model is not None and self.drafted_tokens
+                    else None
+                ),
+            }
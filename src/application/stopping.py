@@ -0,0 +1,55 @@
+import threading
+from typing import List
+
+import torch
+from transformers import StoppingCriteria
+
+# The text checks live in a torch-free module so that server clients can
+# use them; extract_lean_code and lean_code_complete are re-exported here
+from src.application.lean_code import GeneratedText, extract_lean_code, lean_code_complete
+
+
+class LeanCodeStoppingCriteria(StoppingCriteria):
+    """Stops each row of a ``generate`` call once its Lean code is complete.
+
+    Only the tokens generated after ``prompt_length`` are decoded, so the
+    check is independent of the (possibly long) prompt, and each row's text
+    is extended with the new tokens instead of being decoded again.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.rows: List[GeneratedText] = []
+        # Generated tokens already passed to the rows
+        self.consumed = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        if not self.rows:
+            self.rows = [GeneratedText(self.tokenizer) for _ in range(input_ids.shape[0])]
+        # Speculative decoding can accept several tokens in one step
+        start = self.prompt_length + self.consumed
+        new_tokens: List[List[int]] = input_ids[:, start:].tolist()
+        self.consumed += len(new_tokens[0])
+        for row, tokens in zip(self.rows, new_tokens):
+            row.extend(tokens)
+        return torch.tensor(
+            [row.complete for row in self.rows],
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Stops every row once ``cancel`` is set, e.g. when a stream's reader is gone."""
+
+    def __init__(self, cancel: threading.Event):
+        self.cancel = cancel
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        return torch.full(
+            (input_ids.shape[0],),
+            self.cancel.is_set(),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
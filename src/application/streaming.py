@@ -0,0 +1,80 @@
+import queue
+from typing import Iterator, List, Optional
+
+from transformers.generation.streamers import BaseStreamer
+
+_DONE = object()
+
+
+class TokenQueue:
+    """Thread-safe hand-off of generated token ids to a consumer.
+
+    The producer (``model.generate`` on a worker thread, or the scheduler's
+    decode loop) calls ``put`` per token and ``close`` when done; ``close``
+    with an exception re-raises it on the consumer side.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def put(self, token_id: int):
+        self._queue.put(token_id)
+
+    def close(self, error: Optional[BaseException] = None):
+        self._queue.put(error if error is not None else _DONE)
+
+    def __iter__(self) -> Iterator[int]:
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class QueueStreamer(BaseStreamer):
+    """``generate(streamer=...)`` adapter that forwards new token ids."""
+
+    def __init__(self, tokens: TokenQueue):
+        self.tokens = tokens
+        self._prompt_seen = False
+
+    def put(self, value):
+        # The first call carries the prompt ids
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for token_id in value.reshape(-1).tolist():
+            self.tokens.put(token_id)
+
+    def end(self):
+        self.tokens.close()
+
+
+def decode_incrementally(
+    tokenizer, token_ids: Iterator[int], eos_token_id: Optional[int] = None
+) -> Iterator[str]:
+    """Yield decoded text as it becomes stable.
+
+    The whole sequence is re-decoded each step and only the new suffix is
+    emitted, which keeps multi-token characters and tokenizer whitespace
+    handling correct. Output ending in an incomplete UTF-8 sequence is held
+    back until the next token completes it.
+    """
+    ids: List[int] = []
+    emitted = 0
+    for token_id in token_ids:
+        if token_id == eos_token_id:
+            break
+        ids.append(token_id)
+        text = tokenizer.decode(ids, skip_special_tokens=True)
+        if text.endswith("�"):
+            continue
+        if len(text) > emitted:
+            yield text[emitted:]
+            emitted = len(text)
+
+    text = tokenizer.decode(ids, skip_special_tokens=True)
+    if len(text) > emitted:
+        yield text[emitted:]
@@ -0,0 +1,520 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+from src.application.cache import VerificationCache
+from src.application.stopping import extract_lean_code
+from src.entity.verification import LeanMessage, VerificationResult
+
+DEFAULT_REPL_COMMAND = ["lake", "exe", "repl"]
+# Standard header of the DeepSeek-Prover prompts (see test_dspv-7b.py)
+DEFAULT_HEADER = """import Mathlib
+import Aesop
+
+set_option maxHeartbeats 0
+
+open BigOperators Real Nat Topology Rat"""
+
+IMPORT_LINE = re.compile(r"^\s*import\s+\S+.*$", re.MULTILINE)
+# Line comments, nested block comments and string literals (kept verbatim)
+LEAN_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|--[^\n]*|/-|-/')
+INLINE_SPACE = re.compile(r"(?<=\S)[ \t]+")
+STRING_PLACEHOLDER = re.compile(r"\0(\d+)\0")
+
+_EOF = object()
+
+# How often a waiting check looks at its cancel event
+CANCEL_POLL_SECONDS = 0.05
+
+
+def strip_imports(code: str) -> str:
+    # Imports are only allowed at the top of a file; the worker's environment
+    # already has them from the header.
+    return IMPORT_LINE.sub("", code).strip()
+
+
+def normalize_lean(code: str) -> str:
+    """Drop comments, blank lines and repeated spaces from Lean source.
+
+    Leading indentation is kept, since it delimits tactic blocks. String
+    literals are kept verbatim: they are swapped for placeholders while the
+    whitespace around them is normalized.
+    """
+    out = []
+    strings = []
+    depth = 0
+    last = 0
+    for match in LEAN_TOKEN.finditer(code):
+        token = match.group()
+        if depth == 0:
+            out.append(code[last : match.start()])
+        if token == "/-":
+            depth += 1
+        elif token == "-/":
+            if depth == 0:
+                out.append(token)
+            depth = max(depth - 1, 0)
+        elif depth == 0 and token.startswith('"'):
+            out.append(f"\0{len(strings)}\0")
+            strings.append(token)
+        last = match.end()
+    if depth == 0:
+        out.append(code[last:])
+    lines = (INLINE_SPACE.sub(" ", line).rstrip() for line in "".join(out).splitlines())
+    normalized = "\n".join(line for line in lines if line)
+    return STRING_PLACEHOLDER.sub(lambda m: strings[int(m.group(1))], normalized)
+
+
+def environment_id(repl_dir: str, header: str) -> str:
+    """Identifies the environment checks run in.
+
+    Combines the Lean toolchain, the pinned revision of every Lake package
+    and the header, so a Lean or Mathlib upgrade changes it.
+    """
+    parts = [header]
+    toolchain = os.path.join(repl_dir, "lean-toolchain")
+    if os.path.exists(toolchain):
+        with open(toolchain, encoding="utf-8") as f:
+            parts.append(f.read().strip())
+    manifest = os.path.join(repl_dir, "lake-manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            packages = json.load(f).get("packages", [])
+        parts.extend(sorted(f"{p.get('name')}@{p.get('rev')}" for p in packages))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def snapshot_path(repl_dir: str, header: str) -> str:
+    """Where the pickled header environment for this project lives."""
+    return os.path.abspath(
+        os.path.join(
+            repl_dir,
+            ".lake",
+            "snapshots",
+            f"header-{environment_id(repl_dir, header)[:16]}.olean",
+        )
+    )
+
+
+def parse_messages(response: dict) -> List[LeanMessage]:
+    return [
+        LeanMessage(
+            severity=m.get("severity", "error"),
+            text=m.get("data", ""),
+            line=(m.get("pos") or {}).get("line"),
+            column=(m.get("pos") or {}).get("column"),
+        )
+        for m in response.get("messages", [])
+    ]
+
+
+class LeanREPLWorker:
+    """One Lean REPL process with the header already elaborated.
+
+    Talks the JSON protocol of leanprover-community/repl: a command is a JSON
+    object followed by a blank line, and so is each response. The header
+    (imports, options and ``open`` namespaces) is set up once at startup.
+    Every check runs in a fresh copy of that environment, so checks do not
+    see each other's declarations.
+
+    With a ``snapshot`` path, the header environment is restored from that
+    pickle instead of being elaborated again; the first worker to elaborate
+    the header writes it.
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        cwd: str,
+        header: str = DEFAULT_HEADER,
+        startup_timeout: float = 600.0,
+        snapshot: Optional[str] = None,
+    ):
+        self.command = command
+        self.cwd = cwd
+        self.header = header
+        self.startup_timeout = startup_timeout
+        self.snapshot = snapshot
+        self.startup_seconds = 0.0
+        self.from_snapshot = False
+        self.process: Optional[subprocess.Popen] = None
+        self.env: Optional[int] = None
+        self.checks = 0
+        self._responses: "queue.Queue" = queue.Queue()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.kill()
+        start = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(
+                self.command,
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        except FileNotFoundError as e:
+            raise RuntimeError(
+                f"Could not start Lean REPL ({' '.join(self.command)}): {e}"
+            ) from e
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=self._read,
+            args=(self.process.stdout, self._responses),
+            daemon=True,
+        ).start()
+
+        self.from_snapshot = self._restore_snapshot()
+        if not self.from_snapshot:
+            self._elaborate_header()
+        self.checks = 0
+        self.startup_seconds = time.perf_counter() - start
+
+    def _restore_snapshot(self) -> bool:
+        if self.snapshot is None or not os.path.exists(self.snapshot):
+            return False
+        response = self._send({"unpickleEnvFrom": self.snapshot}, self.startup_timeout)
+        if "env" not in response:
+            # Unreadable or incompatible pickle: elaborate and overwrite it
+            print(
+                f"Ignoring Lean header snapshot {self.snapshot}: "
+                f"{response.get('message', response)}"
+            )
+            return False
+        self.env = response["env"]
+        return True
+
+    def _elaborate_header(self):
+        response = self._send({"cmd": self.header}, self.startup_timeout)
+        errors = [m.text for m in parse_messages(response) if m.severity == "error"]
+        if errors or "env" not in response:
+            self.kill()
+            raise RuntimeError(
+                f"Lean REPL header failed: {errors or response.get('message', response)}"
+            )
+        self.env = response["env"]
+        if self.snapshot is not None:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        # Pickle to a private file and rename, so concurrent workers never
+        # read a half-written snapshot
+        os.makedirs(os.path.dirname(self.snapshot), exist_ok=True)
+        partial = f"{self.snapshot[:-len('.olean')]}.{os.getpid()}.{id(self)}.olean"
+        response = self._send({"pickleTo": partial, "env": self.env}, self.startup_timeout)
+        if "message" in response and "env" not in response:
+            print(f"Could not write Lean header snapshot: {response['message']}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+        os.replace(partial, self.snapshot)
+
+    @staticmethod
+    def _read(stdout, responses: "queue.Queue"):
+        lines = []
+        for line in stdout:
+            if line.strip():
+                lines.append(line)
+                continue
+            if lines:
+                try:
+                    responses.put(json.loads("".join(lines)))
+                except json.JSONDecodeError as e:
+                    responses.put(RuntimeError(f"Malformed REPL output: {e}"))
+                lines = []
+        responses.put(_EOF)
+
+    def _send(
+        self, payload: dict, timeout: float, cancel: Optional[threading.Event] = None
+    ) -> dict:
+        try:
+            self.process.stdin.write(json.dumps(payload) + "\n\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RuntimeError(f"Lean REPL exited: {e}") from e
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"Lean REPL did not answer within {timeout:g}s")
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            try:
+                response = self._responses.get(
+                    timeout=min(remaining, CANCEL_POLL_SECONDS) if cancel else remaining
+                )
+                break
+            except queue.Empty:
+                continue
+        if response is _EOF:
+            raise RuntimeError(f"Lean REPL exited with code {self.process.wait()}")
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def check(
+        self, code: str, timeout: float, cancel: Optional[threading.Event] = None
+    ) -> VerificationResult:
+        """Elaborate ``code`` in the header environment.
+
+        Setting ``cancel`` abandons the check; like a timeout, this kills the
+        process, since the REPL cannot interrupt elaboration.
+        """
+        if not self.alive:
+            self.start()
+
+        start = time.perf_counter()
+        try:
+            response = self._send(
+                {"cmd": strip_imports(code), "env": self.env}, timeout, cancel
+            )
+        except CancelledError:
+            self.kill()
+            return VerificationResult(
+                success=False, error="Cancelled", seconds=time.perf_counter() - start
+            )
+        except TimeoutError as e:
+            # The REPL cannot interrupt elaboration, so the process is dropped
+            self.kill()
+            return VerificationResult(
+                success=False,
+                timed_out=True,
+                error=str(e),
+                seconds=time.perf_counter() - start,
+            )
+        except RuntimeError as e:
+            self.kill()
+            return VerificationResult(
+                success=False, error=str(e), seconds=time.perf_counter() - start
+            )
+        self.checks += 1
+
+        if "message" in response and "env" not in response:
+            return VerificationResult(
+                success=False,
+                error=response["message"],
+                seconds=time.perf_counter() - start,
+            )
+        messages = parse_messages(response)
+        return VerificationResult(
+            success=not any(m.severity == "error" for m in messages),
+            messages=messages,
+            sorries=len(response.get("sorries", [])),
+            seconds=time.perf_counter() - start,
+        )
+
+    def kill(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+class LeanVerifier:
+    """Pool of warm Lean REPL workers that type-check generated code.
+
+    Checks are dispatched to idle workers, so up to ``num_workers`` run in
+    parallel. A check that exceeds ``timeout`` or crashes its worker returns
+    a failed result, and the worker is restarted in the background before it
+    takes new checks. Workers are also recycled after ``max_checks`` checks,
+    since REPL memory grows with every command.
+
+    With ``snapshot=True`` the header environment is pickled under
+    ``repl_dir/.lake/snapshots`` the first time it is elaborated, and every
+    later worker start or restart unpickles it instead.
+
+    Definitive results (not timed out, cancelled or failed) are cached by
+    the normalized source and the environment id, optionally persisted at
+    ``cache_path``. Identical code submitted while it is being checked waits
+    for that check instead of starting another.
+    """
+
+    def __init__(
+        self,
+        repl_dir: str = "repl",
+        num_workers: int = 2,
+        timeout: float = 60.0,
+        startup_timeout: float = 600.0,
+        command: Optional[List[str]] = None,
+        header: str = DEFAULT_HEADER,
+        max_checks: int = 200,
+        snapshot: bool = True,
+        cache_path: Optional[str] = None,
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.timeout = timeout
+        self.max_checks = max_checks
+        self.environment = environment_id(repl_dir, header)
+        self.cache = VerificationCache(self.environment, path=cache_path)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.snapshot = snapshot_path(repl_dir, header) if snapshot else None
+        self.workers = [
+            LeanREPLWorker(
+                command or DEFAULT_REPL_COMMAND,
+                repl_dir,
+                header,
+                startup_timeout,
+                self.snapshot,
+            )
+            for _ in range(num_workers)
+        ]
+        self._idle: "queue.Queue[LeanREPLWorker]" = queue.Queue()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="lean"
+        )
+
+    def start(self) -> "LeanVerifier":
+        """Start every worker concurrently; raises if none can start."""
+        print(f"Starting {len(self.workers)} Lean REPL workers...")
+        errors = []
+        pending = list(self.workers)
+        if self.snapshot is not None and not os.path.exists(self.snapshot):
+            # One worker elaborates the header and writes the snapshot that
+            # the others then restore from
+            error = self._try_start(pending[0])
+            if error is not None:
+                errors.append(error)
+            self._idle.put(pending.pop(0))
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as executor:
+            for worker, error in zip(pending, executor.map(self._try_start, pending)):
+                if error is not None:
+                    errors.append(error)
+                self._idle.put(worker)
+        if len(errors) == len(self.workers):
+            raise RuntimeError(f"No Lean REPL worker could start: {errors[0]}")
+        for error in errors:
+            print(f"Lean REPL worker failed to start, will retry on use: {error}")
+        for i, worker in enumerate(self.workers):
+            if worker.alive:
+                source = "snapshot" if worker.from_snapshot else "header"
+                print(f"Lean REPL worker {i} ready in {worker.startup_seconds:.2f}s (from {source})")
+        return self
+
+    @staticmethod
+    def _try_start(worker: LeanREPLWorker) -> Optional[str]:
+        try:
+            worker.start()
+            return None
+        except Exception as e:
+            return str(e)
+
+    def _release(self, worker: LeanREPLWorker):
+        if worker.alive and worker.checks < self.max_checks:
+            self._idle.put(worker)
+            return
+
+        def restart():
+            if self._closed:
+                return
+            error = self._try_start(worker)
+            if error is not None and not self._closed:
+                print(f"Lean REPL worker restart failed, will retry on use: {error}")
+            self._idle.put(worker)
+
+        threading.Thread(target=restart, daemon=True).start()
+
+    def verify(
+        self, code: str, cancel: Optional[threading.Event] = None
+    ) -> VerificationResult:
+        """Type-check one piece of generated code.
+
+        A set ``cancel`` event makes the check return a failed "Cancelled"
+        result, whether it is still waiting for a worker or already running.
+        """
+        code = extract_lean_code(code)
+        start = time.perf_counter()
+        key = normalize_lean(strip_imports(code))
+        while True:
+            result = self.cache.get(key)
+            if result is not None:
+                return replace(result, cached=True, seconds=time.perf_counter() - start)
+            with self._lock:
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = Future()
+                    break
+            # The same code is being checked; reuse its result when definitive
+            result = self._wait(pending, cancel)
+            if result is None:
+                return VerificationResult(success=False, error="Cancelled")
+            if VerificationCache.cacheable(result):
+                return replace(result, cached=True, seconds=time.perf_counter() - start)
+
+        result = VerificationResult(success=False, error="Check did not finish")
+        try:
+            result = self._check(code, cancel)
+            if VerificationCache.cacheable(result):
+                self.cache.put(key, result)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.set_result(result)
+        return result
+
+    @staticmethod
+    def _wait(
+        pending: Future, cancel: Optional[threading.Event]
+    ) -> Optional[VerificationResult]:
+        while cancel is None or not cancel.is_set():
+            try:
+                return pending.result(timeout=CANCEL_POLL_SECONDS if cancel else None)
+            except FutureTimeoutError:
+                continue
+        return None
+
+    def _check(
+        self, code: str, cancel: Optional[threading.Event]
+    ) -> VerificationResult:
+        worker = self._acquire(cancel)
+        if worker is None:
+            return VerificationResult(success=False, error="Cancelled")
+        if cancel is not None and cancel.is_set():
+            self._idle.put(worker)
+            return VerificationResult(success=False, error="Cancelled")
+        try:
+            return worker.check(code, self.timeout, cancel)
+        except Exception as e:
+            # Only a failed restart gets here; report it like any failed check
+            return VerificationResult(success=False, error=str(e))
+        finally:
+            self._release(worker)
+
+    def _acquire(self, cancel: Optional[threading.Event]) -> Optional[LeanREPLWorker]:
+        if cancel is None:
+            return self._idle.get()
+        while not cancel.is_set():
+            try:
+                return self._idle.get(timeout=CANCEL_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def verify_many(self, codes: List[str]) -> List[VerificationResult]:
+        return list(self._executor.map(self.verify, codes))
+
+    def close(self):
+        self._closed = True
+        self.cache.close()
+        for worker in self.workers:
+            worker.kill()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,19 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+
+@dataclass
+class TextChunk:
+    text: str
+    # Heading path from the document title down to the enclosing section
+    headings: List[str] = field(default_factory=list)
+    # "theorem", "definition", "proof", ... for a labelled block, else "text"
+    kind: str = "text"
+    # e.g. "Theorem 2.1.1 (Uniqueness of Limits)"
+    label: Optional[str] = None
+    # 1-based line in the source where the chunk starts
+    start_line: int = 1
+
+    @property
+    def section(self) -> Optional[str]:
+        return self.headings[-1] if self.headings else None
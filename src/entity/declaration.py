@@ -0,0 +1,24 @@
+from typing import Optional
+from dataclasses import dataclass
+
+
+@dataclass
+class MathlibDeclaration:
+    # Fully qualified name, e.g. "Nat.succ_le_iff"
+    name: str
+    # theorem, lemma, def, abbrev, structure, class, inductive or instance
+    kind: str
+    # Binders and type, without the proof or definition body
+    signature: str
+    # Module path, e.g. "Mathlib.Order.Basic"
+    module: str
+    docstring: Optional[str] = None
+    line: int = 0
+
+    @property
+    def text(self) -> str:
+        """The declaration as it is shown in prompts."""
+        header = f"{self.kind} {self.name} {self.signature}".rstrip()
+        if self.docstring:
+            return f"/-- {self.docstring} -/\n{header}"
+        return header
@@ -0,0 +1,27 @@
+from typing import List, Dict, Optional
+from dataclasses import dataclass, field
+
+from src.entity.verification import VerificationResult
+
+
+@dataclass
+class RAGMetrics:
+    mrr: float
+    top_k_recall: Dict[int, float]
+    retrieved_contexts: List[str]
+    query: str
+    ground_truth: Optional[str] = None
+    retrieval_scores: Optional[List[float]] = None
+    # Wall-clock seconds per pipeline stage (retrieval, rerank, generation)
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    rerank_timed_out: bool = False
+    # Prompt tokens spent on retrieved context and how many chunks fit
+    context_tokens: int = 0
+    context_chunks_used: int = 0
+    # Mathlib declarations packed into the prompt, when a Mathlib index is used
+    retrieved_facts: List[str] = field(default_factory=list)
+    # Lean REPL check of the generated code, when verification is enabled
+    verification: Optional[VerificationResult] = None
+    # Best-of-N: candidates sampled and how many were checked before a winner
+    candidates: int = 1
+    candidates_checked: int = 0
@@ -0,0 +1,34 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+
+@dataclass
+class LeanMessage:
+    severity: str
+    text: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+
+
+@dataclass
+class VerificationResult:
+    # Compiled without errors; ``sorry`` only produces a warning
+    success: bool
+    messages: List[LeanMessage] = field(default_factory=list)
+    sorries: int = 0
+    timed_out: bool = False
+    # Set when the check could not run (REPL crash, timeout, bad output)
+    error: Optional[str] = None
+    seconds: float = 0.0
+    # Served from the verification cache instead of the Lean checker
+    cached: bool = False
+
+    @property
+    def errors(self) -> List[LeanMessage]:
+        return [m for m in self.messages if m.severity == "error"]
+
+
+def verification_from_dict(data: dict) -> VerificationResult:
+    data = dict(data)
+    data["messages"] = [LeanMessage(**m) for m in data.get("messages", [])]
+    return VerificationResult(**data)
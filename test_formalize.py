@@ -15,6 +15,17 @@ def test_formalization():
     print("Initializing RAG pipeline...")
     pipeline = MathematicalRAGPipeline()
 
+    methods = ["bm25", "dense", "hybrid"]
+    results = {}
+    for method in methods:
+        print(f"\nGenerating {len(test_queries)} queries with {method.upper()}...")
+        try:
+            results[method] = pipeline.formalize_batch(
+                test_queries, method=method, top_k=3
+            )
+        except Exception as e:
+            results[method] = e
+
     print("\n" + "=" * 60)
     print("TESTING FORMALIZATION WITH RAG")
     print("=" * 60)
@@ -23,29 +34,33 @@ def test_formalization():
         print(f"\n--- Test {i} ---")
         print(f"Query: {query}")
 
-        for method in ["bm25", "dense", "hybrid"]:
+        for method in methods:
             print(f"\nMethod: {method.upper()}")
-            try:
-                lean_code, metrics = pipeline.formalize_with_rag(
-                    query, method=method, top_k=3
-                )
-                print(f"Generated Lean Code:\n{lean_code}")
-                print(f"Retrieved {len(metrics.retrieved_contexts)} context chunks")
-            except Exception as e:
-                print(f"Error with {method}: {e}")
+            if isinstance(results[method], Exception):
+                print(f"Error with {method}: {results[method]}")
+                continue
+            lean_code, metrics = results[method][i - 1]
+            print(f"Generated Lean Code:\n{lean_code}")
+            print(f"Retrieved {len(metrics.retrieved_contexts)} context chunks")
 
     print("\n" + "=" * 60)
     print("TESTING FORMALIZATION WITHOUT RAG")
     print("=" * 60)
 
+    try:
+        no_rag_codes = pipeline.generate_lean_code_batch(test_queries)
+    except Exception as e:
+        no_rag_codes = e
+
     for i, query in enumerate(test_queries, 1):
         print(f"\n--- Test {i} ---")
         print(f"Query: {query}")
-        try:
-            lean_code = pipeline.formalize_without_rag(query)
-            print(f"Generated Lean Code:\n{lean_code}")
-        except Exception as e:
-            print(f"Error: {e}")
+        if isinstance(no_rag_codes, Exception):
+            print(f"Error: {no_rag_codes}")
+        else:
+            print(f"Generated Lean Code:\n{no_rag_codes[i - 1]}")
+
+    print(f"\nRetrieval cache: {pipeline.retrieval_cache.stats()}")
 
 
 if __name__ == "__main__":
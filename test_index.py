@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from src.application.index import FAISS_FILE, RetrievalIndex
+from src.entity.chunk import TextChunk
+
+
+class RandomEmbeddings:
+    """Stands in for the embedding model: a fixed random vector per text."""
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        rng = np.random.default_rng(0)
+        return rng.random((len(texts), self.dim), dtype=np.float32).tolist()
+
+
+def is_mapped(path: str) -> bool:
+    """Whether ``path`` is mapped into this process (Linux only)."""
+    with open("/proc/self/maps", "r") as f:
+        return any(line.rstrip().endswith(os.path.realpath(path)) for line in f)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc/self/maps")
+@pytest.mark.parametrize("index_factory", ["Flat", "SQ8", "HNSW16", "IVF4,Flat"])
+def test_load_memory_maps_faiss_index(tmp_path, index_factory):
+    chunks = [TextChunk(text=f"chunk {i} about limits and series") for i in range(64)]
+    built = RetrievalIndex.build(
+        chunks, RandomEmbeddings(), "random", "hash", index_factory=index_factory
+    )
+    built.save(str(tmp_path))
+    path = str(tmp_path / FAISS_FILE)
+
+    loaded = RetrievalIndex.load(str(tmp_path), mmap=True)
+    assert is_mapped(path)
+    query = np.asarray(RandomEmbeddings().embed_documents(["q"]), dtype=np.float32)
+    _, ids = loaded.faiss_index.search(query, 5)
+    assert ids.shape == (1, 5)
+    del loaded
+
+    eager = RetrievalIndex.load(str(tmp_path), mmap=False)
+    assert not is_mapped(path)
+    assert eager.faiss_index.ntotal == len(chunks)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+from src.application.verification import normalize_lean
+
+
+def test_normalize_lean_drops_comments_and_spaces():
+    code = """theorem t  :  1 = 1 := by   -- trivial
+
+  /- a /- nested -/ comment -/
+  rfl
+"""
+    assert normalize_lean(code) == "theorem t : 1 = 1 := by\n  rfl"
+
+
+def test_normalize_lean_keeps_string_literals():
+    first = 'def s : String := "a  b"\n#eval s.length'
+    second = 'def s : String := "a b"\n#eval s.length'
+    assert normalize_lean(first) != normalize_lean(second)
+    assert normalize_lean(first) == first
+    # Spaces around a literal are still collapsed; blank lines and "--"
+    # inside it are kept
+    assert (
+        normalize_lean('def s  :=  "x -- \\"y\\"\n\n  z"  ++ "w"')
+        == 'def s := "x -- \\"y\\"\n\n  z" ++ "w"'
+    )